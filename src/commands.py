@@ -3,16 +3,19 @@
 # Written by blueberry et al., 2022
 # https://github.com/StardewValleyDiscord/SDVAutumn2022
 
+import asyncio
 import datetime
+import heapq
 import json
 import logging
+import os
 import random
-from importlib import reload
+from collections import Counter, OrderedDict
 from math import ceil, floor
-from typing import Optional, List, Any, Dict
+from typing import Optional, List, Any, Dict, Tuple, Set, FrozenSet
 
-from discord import Reaction, User, Message, Emoji, utils, Interaction, Role, Guild, ButtonStyle, Member, TextChannel, \
-    AllowedMentions, Embed
+from discord import User, Message, Emoji, utils, Interaction, Role, Guild, ButtonStyle, Member, TextChannel, \
+    AllowedMentions, Embed, RawReactionActionEvent, RawMessageUpdateEvent, NotFound, Forbidden, HTTPException
 from discord.abc import GuildChannel
 from discord.ext import commands
 from discord.ext.commands import Cog, Context, BucketType, UserConverter, BadArgument, CommandOnCooldown, Bot, \
@@ -20,11 +23,13 @@ from discord.ext.commands import Cog, Context, BucketType, UserConverter, BadArg
 from discord.ui import View, Button
 
 import config
+import err
 import strings
 import db
 from config import cfg, FISHING_SCOREBOARD, ROLE_HELPER, ROLE_ADMIN, FISHING_BONUS_VALUE, FISHING_BONUS_CHANCE, \
     FISHING_HIGH_VALUE
-from utils import check_roles, requires_admin, get_guild_message, query_channel, CheckFailureQuietly
+from utils import check_roles, requires_admin, get_guild_message, query_channel, mention_to_id, scan_fish, \
+    get_emoji, index_help, remember_message, user_locks, CheckFailureQuietly
 
 """
 Contents:
@@ -34,6 +39,11 @@ Contents:
             Classes
                 SShopView
                 SShopButton
+                SFishingSession
+                SCatchRegistry
+                SReactionFilter
+                SMessageCache
+                SAnnouncer
                 SResponse
             Init
             Command utils
@@ -80,7 +90,7 @@ class SCommands(Cog, name=config.COG_COMMANDS):
                     row=int(i / SCommands.SShopView.ROW_LEN),
                     label=strings.get("shop_role_format").format(role.name, role_data.get("cost")),
                     custom_id=role_data.get("name"),
-                    emoji=utils.get(bot.emojis, name=strings.get(f"emoji_{role_data.get('name')}")))
+                    emoji=get_emoji(bot=bot, name=strings.get(f"emoji_{role_data.get('name')}")))
                 self.add_item(item=button)
 
         async def interaction_check(self, interaction: Interaction, /) -> bool:
@@ -110,22 +120,28 @@ class SCommands(Cog, name=config.COG_COMMANDS):
             """
             msg: str = None
             cost: int = 0
-            balance_current: int = db.get_balance_for(user_id=interaction.user.id)
-
-            # Handle different rows of buttons with different behaviours
-            if self._is_role_button():
-                cost = self._get_role_data().get("cost")
-                if cost <= balance_current:
-                    msg = await self._do_purchase_role(member=interaction.user)
-
-            if not msg:
-                # If no reply message is set, assume the user couldn't afford the shop offer
-                msg = strings.random("shop_responses_poor").format(cost - balance_current)
-            elif cost > 0:
-                # Deduct cost from user's balance
-                db.set_balance_for(user_id=interaction.user.id, value=balance_current - cost)
-                msg_purchased: str = strings.random("shop_responses_purchase").format(cost, balance_current - cost)
-                msg += f"\n{msg_purchased}"
+            # Hold the user's lock until their balance is deducted, so that one balance can't pay for many purchases
+            async with user_locks.hold(interaction.user.id):
+                balance_current: int = await db.balances.get(user_id=interaction.user.id)
+
+                # Handle different rows of buttons with different behaviours
+                if self._is_role_button():
+                    cost = self._get_role_data().get("cost")
+                    if cost <= balance_current:
+                        msg = await self._do_purchase_role(member=interaction.user)
+
+                if not msg:
+                    # If no reply message is set, assume the user couldn't afford the shop offer
+                    msg = strings.random("shop_responses_poor").format(cost - balance_current)
+                elif cost > 0:
+                    # Deduct cost from user's balance
+                    balance_current = await db.balances.add(
+                        user_id=interaction.user.id,
+                        delta=-cost,
+                        source=db.SOURCE_SHOP,
+                        guild_id=interaction.guild_id)
+                    msg_purchased: str = strings.random("shop_responses_purchase").format(cost, balance_current)
+                    msg += f"\n{msg_purchased}"
 
             # Send user-only response depending on purchase and success
             await interaction.response.send_message(content=msg, ephemeral=True)
@@ -133,32 +149,467 @@ class SCommands(Cog, name=config.COG_COMMANDS):
         async def _do_purchase_role(self, member: Member) -> str:
             """
             Removes all shop roles from a user, then awards them the shop role of their choosing.
+            Roles are changed in a single request, replacing the member's roles with their current roles
+            without any shop roles, plus the chosen shop role and generic event role.
             Does not check or deduct user's balance.
             :param member: User to award role to.
             :return: Confirmation message.
             """
             role_data: dict = self._get_role_data()
-            roles_add: List[Role] = [utils.get(member.guild.roles, id=role_id)
-                                     for role_id in [role_data.get("id"), config.ROLE_EVENT]]
-            roles_remove: List[Role] = [utils.get(member.guild.roles, id=rd.get("id"))
-                                        for rd in config.SHOP_ROLE_LIST
-                                        if member.get_role(rd.get("id"))]
+            roles_add: List[Role] = [role for role in [member.guild.get_role(role_id)
+                                                       for role_id in [role_data.get("id"), config.ROLE_EVENT]]
+                                     if role]
+            roles: List[Role] = [role for role in member.roles
+                                 if not role.is_default() and role.id not in config.SHOP_ROLE_IDS and role not in roles_add] \
+                + roles_add
             log_reason: str = strings.get("log_role_purchase")
 
-            # Remove other shop roles
-            await member.remove_roles(*[role for role in roles_remove if role], reason=log_reason)
-            # Add selected shop role, as well as generic event role
-            await member.add_roles(*[role for role in roles_add if role], reason=log_reason)
+            # Remove other shop roles, and add selected shop role as well as generic event role
+            if set(roles) != set(role for role in member.roles if not role.is_default()):
+                await member.edit(roles=roles, reason=log_reason)
 
             msg: str = strings.get("shop_responses_purchase_role")[role_data.get("response_index")]
             return msg
 
         def _get_role_data(self) -> dict:
-            return next(rd for rd in config.SHOP_ROLE_LIST if rd.get("name") == self.custom_id)
+            return config.SHOP_ROLES[self.custom_id]
 
         def _is_role_button(self) -> bool:
             return self.row < len(config.SHOP_ROLE_LIST) / SCommands.SShopView.ROW_LEN
 
+    class SFishingSession:
+        """
+        Record of messages each user has reacted to in the fishing challenge, kept only while a catch could still count.
+
+        Entries are evicted in order of expiry once a catch period has passed since both the end of the message's
+        catch period and the reaction, by which time the message has been dropped from the catch registry.
+        """
+        def __init__(self, duration: datetime.timedelta):
+            self.duration: datetime.timedelta = duration
+            """Catch period after a message is sent in which reactions to it will count."""
+            self._keys: Set[Tuple[int, int]] = set()
+            """Set of Discord user IDs and message IDs for all reactions in the session."""
+            self._expiry: List[Tuple[datetime.datetime, int, int]] = []
+            """Heap of expiry times, Discord user IDs, and message IDs for all reactions in the session, earliest first."""
+
+        def __len__(self) -> int:
+            return len(self._keys)
+
+        def _evict(self, time_now: datetime.datetime) -> None:
+            while self._expiry and self._expiry[0][0] <= time_now:
+                _, user_id, message_id = heapq.heappop(self._expiry)
+                self._keys.discard((user_id, message_id))
+
+        def add(self, user_id: int, message_id: int, time_msg: datetime.datetime, time_now: datetime.datetime) -> bool:
+            """
+            Adds a user's reaction to a message to the session, evicting any expired reactions.
+            :param user_id: Discord user ID for the user reacting to the message.
+            :param message_id: Discord message ID for the message reacted to.
+            :param time_msg: Time the message was sent.
+            :param time_now: Time the reaction was added.
+            :returns: Whether the reaction was added, or false if the user had already reacted to this message.
+            """
+            self._evict(time_now=time_now)
+            key: Tuple[int, int] = (user_id, message_id)
+            if key in self._keys:
+                return False
+            self._keys.add(key)
+            heapq.heappush(self._expiry, (max(time_msg + self.duration, time_now) + self.duration, user_id, message_id))
+            return True
+
+    class SCatchRegistry:
+        """
+        Scores for fish caught in staff messages, computed once when each message is sent.
+
+        Reactions to messages resolve their catch with a single lookup, and messages without fish or outside of
+        the registry are dropped without scanning their content.
+        Catches are kept for a catch period after they expire, so that late reactions are still told they timed out,
+        and are then evicted in order of expiry.
+        Messages sent before the registry was created may have been missed, and are checked once each when reacted to
+        while they could still be caught.
+        All staff messages are kept for the same time as catches, so that edits to them are scored again.
+        """
+        class SCatch:
+            """
+            Fish caught in a single message.
+            """
+            __slots__ = ("counts", "value", "expiry")
+
+            def __init__(self, counts: Dict[str, int], value: int, expiry: datetime.datetime):
+                self.counts: Dict[str, int] = counts
+                """Map of all fish in scoreboard order to the number of each caught."""
+                self.value: int = value
+                """Total value of fish caught."""
+                self.expiry: datetime.datetime = expiry
+                """Time after which the catch will no longer be added to balances."""
+
+        def __init__(self, duration: datetime.timedelta):
+            self.duration: datetime.timedelta = duration
+            """Catch period after a message is sent in which reactions to it will count."""
+            self._catches: Dict[int, SCommands.SCatchRegistry.SCatch] = {}
+            """Map of Discord message IDs to fish caught in each message."""
+            self._messages: Set[int] = set()
+            """Set of Discord message IDs for all staff messages scored, with or without fish."""
+            self._expiry: List[Tuple[datetime.datetime, int]] = []
+            """Heap of eviction times and Discord message IDs for all staff messages scored, earliest first."""
+            self.started_at: datetime.datetime = datetime.datetime.now(tz=datetime.timezone.utc)
+            """Time the registry was created, after which all messages sent are scored as they're sent."""
+            self._checked: Set[int] = set()
+            """Set of Discord message IDs sent before the registry was created that have been checked for catches."""
+
+        def __len__(self) -> int:
+            return len(self._catches)
+
+        def _evict(self, time_now: datetime.datetime) -> None:
+            while self._expiry and self._expiry[0][0] <= time_now:
+                _, message_id = heapq.heappop(self._expiry)
+                self._catches.pop(message_id, None)
+                self._messages.discard(message_id)
+
+        def _score(self, message_id: int, content: str) -> Optional["SCommands.SCatchRegistry.SCatch"]:
+            """
+            Scores the fish caught in a message, replacing any catch for the message.
+            """
+            fish_counts: Dict[str, int]
+            fish_value: int
+            fish_counts, fish_value = scan_fish(content=content, scoreboard=FISHING_SCOREBOARD)
+
+            # Ignore the catch if message had no fish emoji
+            if all(FISHING_SCOREBOARD[fish] * count == 0 for fish, count in fish_counts.items()):
+                self._catches.pop(message_id, None)
+                return None
+
+            catch: SCommands.SCatchRegistry.SCatch = SCommands.SCatchRegistry.SCatch(
+                counts=fish_counts,
+                value=fish_value,
+                expiry=utils.snowflake_time(message_id) + self.duration)
+            self._catches[message_id] = catch
+            return catch
+
+        def add(self, message: Message) -> Optional["SCommands.SCatchRegistry.SCatch"]:
+            """
+            Scores the fish caught in a message and adds the catch to the registry, if any fish were found.
+            :param message: Staff message to score.
+            :returns: Catch for the message, if any fish were found.
+            """
+            if message.id not in self._messages:
+                self._messages.add(message.id)
+                heapq.heappush(self._expiry, (utils.snowflake_time(message.id) + self.duration * 2, message.id))
+            return self._score(message_id=message.id, content=message.content)
+
+        def update(self, message_id: int, content: str, time_now: datetime.datetime) -> Optional["SCommands.SCatchRegistry.SCatch"]:
+            """
+            Scores again the fish caught in an edited staff message, while it can still be caught.
+            Catches in messages edited to remove all fish are removed.
+            :param message_id: Discord message ID for the message edited.
+            :param content: Message content after the edit.
+            :param time_now: Time the message was edited.
+            :returns: Catch for the message, if it's a staff message that can still be caught and any fish were found.
+            """
+            self._evict(time_now=time_now)
+            if message_id not in self._messages or time_now >= utils.snowflake_time(message_id) + self.duration:
+                return None
+            return self._score(message_id=message_id, content=content)
+
+        def get(self, message_id: int, time_now: datetime.datetime) -> Optional["SCommands.SCatchRegistry.SCatch"]:
+            """
+            Gets the catch for a message, evicting any expired catches.
+            :param message_id: Discord message ID for the message reacted to.
+            :param time_now: Time the reaction was added.
+            :returns: Catch for the message, if it's known and not yet evicted.
+            """
+            self._evict(time_now=time_now)
+            return self._catches.get(message_id)
+
+        def __contains__(self, message_id: int) -> bool:
+            return message_id in self._catches
+
+        def is_missed(self, message_id: int, time_now: datetime.datetime) -> bool:
+            """
+            Checks whether a message may have been a catch sent before the registry was created, and has not been
+            checked since.
+            :param message_id: Discord message ID for the message reacted to.
+            :param time_now: Time the reaction was added.
+            """
+            time_msg: datetime.datetime = utils.snowflake_time(message_id)
+            return time_msg < self.started_at \
+                and time_now < time_msg + self.duration * 2 \
+                and message_id not in self._checked
+
+        def add_missed(self, message_id: int, message: Optional[Message]) -> Optional["SCommands.SCatchRegistry.SCatch"]:
+            """
+            Adds a catch for a message sent before the registry was created, marking the message as checked.
+            :param message_id: Discord message ID for the message reacted to.
+            :param message: Message fetched for the message ID, or none if it couldn't be fetched.
+            :returns: Catch for the message, if it was sent by staff and any fish were found.
+            """
+            self._checked.add(message_id)
+            if not message or message.author.bot or not check_roles(user=message.author, role_ids=[ROLE_ADMIN, ROLE_HELPER]):
+                return None
+            return self.add(message=message)
+
+    class SReactionFilter:
+        """
+        Checks run on every reaction before any handlers, rejecting reactions that can't affect any feature.
+
+        Channels and feature flags are read from config once and rebuilt when features are enabled or disabled,
+        and fishing messages by staff authors are found in the catch registry, so most reactions are dropped after
+        a few hash lookups without fetching their message.
+        Reactions by bots are dropped, as are reactions to recent messages sent by bots in submission channels,
+        such as the bot's own replies. Messages by bots sent before the filter was created are still rejected
+        by the handlers.
+        Counts of reactions dropped and passed at each stage are kept for the session.
+        """
+        STAGES: List[str] = ["received", "dropped_bot", "dropped_channel", "dropped_staff", "dropped_missing",
+                             "submission", "fishing"]
+        """Stages counted for all reactions, in order checked."""
+
+        def __init__(self, catches: "SCommands.SCatchRegistry"):
+            self.catches: SCommands.SCatchRegistry = catches
+            """Catch registry with all staff messages that can be fished from."""
+            self.counts: Counter = Counter()
+            """Number of reactions reaching each stage."""
+            self.submission_channels: FrozenSet[int] = frozenset()
+            """Discord channel IDs for all channels with submissions, or none if submissions are disabled."""
+            self.is_fishing_enabled: bool = False
+            """Whether the fishing game is enabled."""
+            self.bot_messages: OrderedDict[int, None] = OrderedDict()
+            """Discord message IDs for recent messages sent by bots in submission channels, oldest first."""
+            self.rebuild()
+
+        def rebuild(self) -> None:
+            """
+            Reads channels and feature flags from config, to be called whenever they're changed.
+            """
+            self.submission_channels = frozenset([config.CHANNEL_ART, config.CHANNEL_FOOD]) \
+                if config.SUBMISSION_ENABLED else frozenset()
+            self.is_fishing_enabled = config.FISHING_ENABLED
+
+        def add_bot_message(self, message_id: int) -> None:
+            """
+            Adds a message sent by a bot in a submission channel, evicting the oldest beyond the message cache size.
+            """
+            self.bot_messages[message_id] = None
+            while len(self.bot_messages) > config.MESSAGE_CACHE_SIZE:
+                self.bot_messages.popitem(last=False)
+
+        def check(self, payload: RawReactionActionEvent, time_now: datetime.datetime) -> Tuple[bool, bool]:
+            """
+            Checks which handlers a reaction should be passed to.
+            :param payload: Reaction event for a given emoji on a message.
+            :param time_now: Time the reaction was added.
+            :returns: Whether to handle the reaction as a submission verification, and as a fishing catch.
+            """
+            user: Optional[Member] = payload.member
+            self.counts["received"] += 1
+            if not user or user.bot or payload.message_id in self.bot_messages:
+                self.counts["dropped_bot"] += 1
+                return False, False
+
+            is_submission: bool = payload.channel_id in self.submission_channels
+            is_fishing: bool = self.is_fishing_enabled \
+                and (payload.message_id in self.catches
+                     or self.catches.is_missed(message_id=payload.message_id, time_now=time_now))
+            if not is_submission and not is_fishing:
+                self.counts["dropped_channel"] += 1
+                return False, False
+
+            # Only staff reactions verify submissions
+            if is_submission and not check_roles(user=user, role_ids=[ROLE_ADMIN, ROLE_HELPER]):
+                is_submission = False
+                if not is_fishing:
+                    self.counts["dropped_staff"] += 1
+                    return False, False
+
+            self.counts["submission"] += is_submission
+            self.counts["fishing"] += is_fishing
+            return is_submission, is_fishing
+
+    class SMessageCache:
+        """
+        Bounded cache of messages that reactions may need to be handled for, fetching messages missing from the cache.
+
+        Only submissions not yet verified are kept, as catches are scored when they're sent and don't need their
+        message afterwards, so the bot's global message cache isn't needed to handle reactions.
+        Up to a maximum number of messages are kept, with the least-recently used messages evicted.
+        """
+        def __init__(self, bot: Bot, max_size: int):
+            self.bot: Bot = bot
+            self.max_size: int = max_size
+            """Maximum number of messages kept."""
+            self._messages: OrderedDict[int, Message] = OrderedDict()
+            """Map of Discord message IDs to messages, least-recently used first."""
+
+        def __len__(self) -> int:
+            return len(self._messages)
+
+        def __contains__(self, message_id: int) -> bool:
+            return message_id in self._messages
+
+        def add(self, message: Message) -> None:
+            """
+            Adds a message to the cache, evicting the least-recently used messages beyond the maximum size.
+            """
+            self._messages[message.id] = message
+            self._messages.move_to_end(message.id)
+            while len(self._messages) > self.max_size:
+                self._messages.popitem(last=False)
+
+        def discard(self, message_id: int) -> None:
+            """
+            Removes a message from the cache, if it's kept.
+            """
+            self._messages.pop(message_id, None)
+
+        async def fetch(self, channel_id: int, message_id: int, is_cached: bool = True) -> Optional[Message]:
+            """
+            Gets a message from the cache, or fetches it from its channel if it's not kept.
+            :param channel_id: Discord channel ID for the channel containing the message.
+            :param message_id: Discord message ID for the message.
+            :param is_cached: Whether to add the message to the cache if fetched.
+            :returns: Message instance, if found.
+            """
+            message: Optional[Message] = self._messages.get(message_id)
+            if message:
+                self._messages.move_to_end(message_id)
+                return message
+            channel: Optional[TextChannel] = self.bot.get_channel(channel_id)
+            if not isinstance(channel, TextChannel):
+                return None
+            try:
+                message = await channel.fetch_message(message_id)
+            except (NotFound, Forbidden):
+                return None
+            if is_cached:
+                self.add(message=message)
+            return message
+
+    class SAnnouncer:
+        """
+        Queue of announcements to a channel, coalesced into as few messages as possible over a short window.
+
+        The first announcement queued starts the window, and all announcements queued before it ends are sent together,
+        split across messages only where they would exceed the message length limit, so bursts of announcements
+        don't hit the channel's rate limit.
+        Messages that fail to send with a server error, or while the channel is unavailable, are retried with the next
+        window up to a maximum number of times, and messages rejected by Discord are dropped.
+        """
+        MAX_LENGTH: int = 2000
+        """Maximum number of characters in a single Discord message."""
+        MAX_RETRIES: int = 3
+        """Number of windows in a row unsent announcements are retried in before they're dropped."""
+
+        def __init__(self, bot: Bot, channel_id: int, window: float):
+            self.bot: Bot = bot
+            self.channel_id: int = channel_id
+            """Discord channel ID for the channel announcements are sent to."""
+            self.window: float = window
+            """Number of seconds announcements are queued before being sent."""
+            self._queue: List[str] = []
+            """Announcements queued in the current window, in order."""
+            self._task: Optional[asyncio.Task] = None
+            """Task sending the current window's announcements once it ends, if any are queued."""
+            self._retries: int = 0
+            """Number of windows in a row that failed to send all announcements."""
+
+        def __len__(self) -> int:
+            return len(self._queue)
+
+        def add(self, msg: str) -> None:
+            """
+            Queues an announcement, starting a new window if none is open.
+            """
+            self._queue.append(msg)
+            self._schedule()
+
+        def _schedule(self) -> None:
+            if not self._task:
+                self._task = asyncio.create_task(self._flush_later())
+
+        @staticmethod
+        def split(msgs: List[str], max_length: int = MAX_LENGTH) -> List[str]:
+            """
+            Joins announcements into as few messages as possible, each no longer than the maximum length.
+            Announcements are only split themselves when they're longer than the maximum length alone.
+            :param msgs: Announcements to join, in order.
+            :param max_length: Maximum number of characters in each message.
+            :returns: List of messages to send, in order.
+            """
+            contents: List[str] = []
+            current: str = ""
+            for msg in msgs:
+                while len(msg) > max_length:
+                    if current:
+                        contents.append(current)
+                        current = ""
+                    contents.append(msg[:max_length])
+                    msg = msg[max_length:]
+                if current and len(current) + 1 + len(msg) > max_length:
+                    contents.append(current)
+                    current = ""
+                current = f"{current}\n{msg}" if current else msg
+            if current:
+                contents.append(current)
+            return contents
+
+        async def _flush_later(self) -> None:
+            await asyncio.sleep(self.window)
+            self._task = None
+            await self.flush()
+
+        async def flush(self) -> None:
+            """
+            Sends all queued announcements now.
+            Announcements that couldn't be sent are kept to be sent with the next window.
+            """
+            msgs: List[str] = self._queue
+            self._queue = []
+            if not msgs:
+                return
+            contents: List[str] = SCommands.SAnnouncer.split(msgs=msgs)
+            unsent: List[str] = []
+            try:
+                channel: Optional[TextChannel] = self.bot.get_channel(self.channel_id)
+                if not channel:
+                    unsent = contents
+                    contents = []
+                while contents:
+                    try:
+                        await channel.send(content=contents[0], allowed_mentions=AllowedMentions(users=True))
+                    except HTTPException as error:
+                        err.log(error)
+                        # Retry only on server errors and rate limits, as others would fail the same way again
+                        if error.status >= 500 or error.status == 429:
+                            unsent = contents
+                            contents = []
+                            break
+                    contents.pop(0)
+            finally:
+                # Keep unsent announcements ahead of any queued while sending, unless they've been retried too often
+                unsent += contents
+                if not unsent:
+                    self._retries = 0
+                elif self._retries < SCommands.SAnnouncer.MAX_RETRIES:
+                    self._retries += 1
+                    self._queue = unsent + self._queue
+                else:
+                    self._retries = 0
+            if self._queue:
+                self._schedule()
+
+        async def close(self) -> None:
+            """
+            Sends all queued announcements without waiting for the current window to end.
+            """
+            if self._task:
+                self._task.cancel()
+                self._task = None
+            await self.flush()
+            # Nothing will be retried once closed
+            if self._task:
+                self._task.cancel()
+                self._task = None
+
     class SResponse:
         """
         Container for response messages and balance values from using a command.
@@ -171,6 +622,9 @@ class SCommands(Cog, name=config.COG_COMMANDS):
 
     # Init
 
+    HISTORY_PAGE_LEN: int = 10
+    """Number of ledger entries shown per page of balance history."""
+
     def __init__(self, bot: Bot):
         super().__init__()
 
@@ -179,24 +633,69 @@ class SCommands(Cog, name=config.COG_COMMANDS):
         Main bot instance.
         """
 
-        self.submission_session: List[int] = []
+        self.fishing_session: SCommands.SFishingSession = SCommands.SFishingSession(
+            duration=datetime.timedelta(seconds=config.FISHING_DURATION_SECONDS))
         """
-        List of Discord message IDs that have been reacted to in the submission channels.
+        Record of messages each user has reacted to in the fishing challenge.
         
-        A list sharing the lifetime of the bot session is fine here as messages sent outside of the session
-        have no effect on reactions, so we don't need to check whether a reaction was already added.
+        Messages sent outside of the session have no effect on reactions, so we don't need to check whether
+        a reaction was already added to them.
         """
 
-        self.fishing_session: Dict[int, List[int]] = {}
+        self.fishing_catches: SCommands.SCatchRegistry = SCommands.SCatchRegistry(
+            duration=datetime.timedelta(seconds=config.FISHING_DURATION_SECONDS))
         """
-        Map of Discord user IDs to message IDs they have reacted to in the fishing challenge.
-        
-        A map sharing the lifetime of the bot session is fine here as messages sent outside of the session
-        have no effect on reactions, so we don't need to check whether a reaction was already added.
+        Fish caught in staff messages sent during the session, scored as they're sent.
+        """
+
+        self.reaction_filter: SCommands.SReactionFilter = SCommands.SReactionFilter(catches=self.fishing_catches)
+        """
+        Checks run on every reaction before any handlers.
+        """
+
+        self.messages: SCommands.SMessageCache = SCommands.SMessageCache(bot=bot, max_size=config.MESSAGE_CACHE_SIZE)
+        """
+        Messages that reactions may need to be handled for, in place of the bot's global message cache.
+        """
+
+        self.fishing_announcer: SCommands.SAnnouncer = SCommands.SAnnouncer(
+            bot=bot,
+            channel_id=config.CHANNEL_FISHING,
+            window=config.FISHING_ANNOUNCE_SECONDS)
+        """
+        Announcements for fish caught, sent to the fishing channel together for all catches in a short window.
+        """
+
+        self.shop_views: Dict[int, SCommands.SShopView] = {}
+        """
+        Map of Discord guild IDs to shop views registered for each guild's shop message.
         """
 
+    async def cog_unload(self) -> None:
+        # Send any announcements still queued before commands are reloaded
+        await self.fishing_announcer.close()
+
     # Command utils
 
+    def _get_shop_view(self, guild: Guild) -> SShopView:
+        """
+        Gets the shop view for a guild, creating it if it's not yet been created.
+        The same view is used for the lifetime of the commands extension, so that it stays registered for the shop message.
+        """
+        view: Optional[SCommands.SShopView] = self.shop_views.get(guild.id)
+        if not view:
+            view = self.shop_views[guild.id] = SCommands.SShopView(guild=guild, bot=self.bot)
+        return view
+
+    async def _register_shop_views(self) -> None:
+        """
+        Registers the shop view for the shop message in each guild, so that shop buttons are handled after restarts.
+        """
+        for guild in self.bot.guilds:
+            message_id: Optional[int] = await db.get_shop_message_id_async(guild_id=guild.id)
+            if message_id:
+                self.bot.add_view(view=self._get_shop_view(guild=guild), message_id=message_id)
+
     def _log_admin(self, msg_key: str, user: User, value: Any = None):
         msg: str = strings.get(msg_key).format(
             user.name,
@@ -207,18 +706,38 @@ class SCommands(Cog, name=config.COG_COMMANDS):
         logger: logging.Logger = logging.getLogger("discord")
         logger.log(level=logging.DEBUG, msg=msg)
 
-    def _add_balance(self, guild_id: int, user_id: int, value: int) -> int:
-        balance_current: int = db.get_balance_for(user_id=user_id)
-        balance_current = db.set_balance_for(user_id=user_id, value=balance_current + value)
+    async def _add_balance(self, guild_id: int, user_id: int, value: int, source: str) -> int:
+        balance_current: int = await db.balances.add(user_id=user_id, delta=value, source=source, guild_id=guild_id)
         if value > 0:
             self._add_earnings(guild_id=guild_id, value=value)
         return balance_current
 
-    def _add_earnings(self, guild_id: int, value: int) -> int:
-        earnings_current: int = db.get_guild_earnings(guild_id=guild_id)
+    def _add_earnings(self, guild_id: int, value: int) -> None:
         if value > 0:
-            earnings_current = db.set_guild_earnings(guild_id=guild_id, value=earnings_current + value)
-        return earnings_current
+            db.earnings.add(guild_id=guild_id, delta=value)
+
+    def _query_members(self, guild: Guild, queries: Tuple[str]) -> Tuple[List[Member], List[str]]:
+        """
+        Finds guild members from the guild cache for a list of user or role IDs or mentions.
+        :param guild: Guild to find members in.
+        :param queries: Discord user or role IDs or mentions, where roles include all of their members.
+        :return: List of unique members found, and list of queries with no matching user or role.
+        """
+        members: Dict[int, Member] = {}
+        failed: List[str] = []
+        for query in queries:
+            found: List[Member] = []
+            try:
+                query_id: int = mention_to_id(query)
+                member: Optional[Member] = guild.get_member(query_id)
+                role: Optional[Role] = guild.get_role(query_id) if not member else None
+                found = [member] if member else role.members if role else []
+            except ValueError:
+                pass
+            if not any(found):
+                failed.append(query)
+            members.update({m.id: m for m in found if not m.bot})
+        return list(members.values()), failed
 
     # Default user commands
 
@@ -235,23 +754,25 @@ class SCommands(Cog, name=config.COG_COMMANDS):
         if not config.WHEEL_ENABLED:
             return
         msg: str
-        balance_current: int = db.get_balance_for(user_id=ctx.author.id)
-        if value <= 0:
-            raise BadArgument()
-        elif balance_current < value:
-            msg = strings.random("shop_responses_poor").format(value - balance_current)
-        else:
-            query_clean: str = colour.strip().lower()
-            is_green: bool = query_clean.startswith("g") or query_clean.startswith("b")
-            is_orange: bool = query_clean.startswith("o") or query_clean.startswith("r")
-            if not is_green and not is_orange:
-                msg = strings.random("wheel_responses_colour")
+        # Hold the user's lock until their bet is settled, so that one balance can't cover many bets
+        async with user_locks.hold(ctx.author.id):
+            balance_current: int = await db.balances.get(user_id=ctx.author.id)
+            if value <= 0:
+                raise BadArgument()
+            elif balance_current < value:
+                msg = strings.random("shop_responses_poor").format(value - balance_current)
             else:
-                response: SCommands.SResponse = self._do_wheel(guild_id=ctx.guild.id, user_id=ctx.author.id, value=value, is_green=is_green)
-                response_key: str = 'balance_responses_added' if response.value > 0 else 'balance_responses_removed'
-                if response.value != 0:
-                    response.msg += f"\n{strings.random(response_key).format(response.value)}"
-                msg = response.msg
+                query_clean: str = colour.strip().lower()
+                is_green: bool = query_clean.startswith("g") or query_clean.startswith("b")
+                is_orange: bool = query_clean.startswith("o") or query_clean.startswith("r")
+                if not is_green and not is_orange:
+                    msg = strings.random("wheel_responses_colour")
+                else:
+                    response: SCommands.SResponse = await self._do_wheel(guild_id=ctx.guild.id, user_id=ctx.author.id, value=value, is_green=is_green)
+                    response_key: str = 'balance_responses_added' if response.value > 0 else 'balance_responses_removed'
+                    if response.value != 0:
+                        response.msg += f"\n{strings.random(response_key).format(response.value)}"
+                    msg = response.msg
         await ctx.reply(content=msg)
 
     @commands.command(name=strings.get("command_name_fortune"))
@@ -273,7 +794,7 @@ class SCommands(Cog, name=config.COG_COMMANDS):
         """
         if not config.STRENGTH_ENABLED:
             return
-        response: SCommands.SResponse = self._do_strength(guild_id=ctx.guild.id, user_id=ctx.author.id)
+        response: SCommands.SResponse = await self._do_strength(guild_id=ctx.guild.id, user_id=ctx.author.id)
         if response.value > 0:
             response.msg += f"\n{strings.random('balance_responses_added').format(response.value)}"
         await ctx.reply(content=response.msg)
@@ -292,8 +813,8 @@ class SCommands(Cog, name=config.COG_COMMANDS):
             user: User = await UserConverter().convert(
                 ctx=ctx,
                 argument=str(user_query).strip())
-            response: SCommands.SResponse = self._do_balance_get(author=ctx.author, user=user)
-            emoji: Emoji = utils.get(self.bot.emojis, name=strings.get("emoji_shop"))
+            response: SCommands.SResponse = await self._do_balance_get(author=ctx.author, user=user)
+            emoji: Emoji = get_emoji(bot=self.bot, name=strings.get("emoji_shop"))
             msg = f"{emoji}\t{response.msg}"
         except BadArgument:
             msg = strings.get("commands_error_user")
@@ -312,13 +833,45 @@ class SCommands(Cog, name=config.COG_COMMANDS):
             user: User = await UserConverter().convert(
                 ctx=ctx,
                 argument=str(user_query).strip())
-            response: SCommands.SResponse = self._do_balance_set(guild_id=ctx.guild.id, user_from=ctx.author, user_to=user, value=value)
-            emoji: Emoji = utils.get(self.bot.emojis, name=strings.get("emoji_shop"))
+            response: SCommands.SResponse = await self._do_balance_set(guild_id=ctx.guild.id, user_from=ctx.author, user_to=user, value=value)
+            emoji: Emoji = get_emoji(bot=self.bot, name=strings.get("emoji_shop"))
             msg = f"{emoji}\t{response.msg}"
         except BadArgument:
             msg = strings.get("commands_error_user")
         await ctx.reply(content=msg)
 
+    @commands.command(name=strings.get("command_name_history"))
+    async def cmd_history(self, ctx: Context, user_query: str = None, before: int = None) -> None:
+        """
+        Get your recent Star Token history, or another user by ID.
+        :param ctx:
+        :param user_query: Discord user ID, mention, or name to get history for.
+        :param before: Entry number to show older history from.
+        """
+        msg: str
+        try:
+            if not user_query:
+                user_query = ctx.author.id
+            user: User = await UserConverter().convert(
+                ctx=ctx,
+                argument=str(user_query).strip())
+            response: SCommands.SResponse = await self._do_history(user=user, before_id=before)
+            emoji: Emoji = get_emoji(bot=self.bot, name=strings.get("emoji_shop"))
+            msg = f"{emoji}\t{response.msg}"
+        except BadArgument:
+            msg = strings.get("commands_error_user")
+        await ctx.reply(content=msg)
+
+    @commands.command(name=strings.get("command_name_leaderboard"))
+    async def cmd_leaderboard(self, ctx: Context) -> None:
+        """
+        Get the users with the most Star Tokens.
+        """
+        response: SCommands.SResponse = await self._do_leaderboard()
+        emoji: Emoji = get_emoji(bot=self.bot, name=strings.get("emoji_shop"))
+        msg: str = f"{emoji}\t{response.msg}"
+        await ctx.reply(content=msg)
+
     # Admin commands
 
     @commands.command(name=strings.get("command_name_award"))
@@ -337,13 +890,39 @@ class SCommands(Cog, name=config.COG_COMMANDS):
             user: User = await UserConverter().convert(
                 ctx=ctx,
                 argument=str(user_query).strip())
-            response: SCommands.SResponse = self._do_award(guild_id=ctx.guild.id, user=user, value=value)
-            emoji: Emoji = utils.get(self.bot.emojis, name=strings.get("emoji_shop"))
+            response: SCommands.SResponse = await self._do_award(guild_id=ctx.guild.id, user=user, value=value)
+            emoji: Emoji = get_emoji(bot=self.bot, name=strings.get("emoji_shop"))
             msg = f"{emoji}\t{response.msg}"
         except BadArgument:
             msg = strings.get("commands_error_user")
         await ctx.reply(content=msg)
 
+    @commands.command(name=strings.get("command_name_award_many"))
+    @commands.check(requires_admin)
+    async def cmd_award_many(self, ctx: Context, value: int, *user_queries: str) -> None:
+        """
+        Give an amount to many users' balances at once, including all users with a given role.
+
+        Negative values will be deducted from their balances.
+        :param ctx:
+        :param value: Value to be added to each balance.
+        :param user_queries: Discord user or role IDs or mentions to set balance for.
+        """
+        if not any(user_queries):
+            raise BadArgument()
+        # Members aren't fetched on startup, so fetch all members before finding those with roles
+        if not ctx.guild.chunked:
+            await ctx.guild.chunk()
+        members: List[Member]
+        failed: List[str]
+        members, failed = self._query_members(guild=ctx.guild, queries=user_queries)
+        response: SCommands.SResponse = await self._do_award_many(guild_id=ctx.guild.id, members=members, value=value)
+        emoji: Emoji = get_emoji(bot=self.bot, name=strings.get("emoji_shop"))
+        msg: str = f"{emoji}\t{response.msg}"
+        if any(failed):
+            msg += "\n" + strings.get("award_many_response_failed").format(", ".join(failed))
+        await ctx.reply(content=msg[:2000])
+
     @commands.command(name=strings.get("command_name_earnings"), hidden=True)
     @commands.check(requires_admin)
     async def cmd_earnings(self, ctx: Context, value: int = None) -> None:
@@ -355,13 +934,14 @@ class SCommands(Cog, name=config.COG_COMMANDS):
         :param value: Optional balance change to apply to the total earnings.
         """
         msg: str
-        earnings_current: int = db.get_guild_earnings(guild_id=ctx.guild.id)
         if not value:
             # Omitting value will get current earnings
+            earnings_current: int = await db.earnings.get(guild_id=ctx.guild.id)
             msg = strings.get("commands_response_earnings_get").format(earnings_current)
         else:
             # Including value will change current earnings
-            earnings_total: int = db.set_guild_earnings(guild_id=ctx.guild.id, value=earnings_current + value)
+            db.earnings.add(guild_id=ctx.guild.id, delta=value)
+            earnings_total: int = await db.earnings.get(guild_id=ctx.guild.id)
             msg = strings.get("commands_response_earnings_set").format(earnings_total, f"+{value}" if value >= 0 else value)
         await ctx.reply(content=msg)
 
@@ -383,6 +963,7 @@ class SCommands(Cog, name=config.COG_COMMANDS):
     async def cmd_enable_submission(self, ctx: Context, is_enabled: bool = None) -> None:
         if is_enabled is not None:
             config.SUBMISSION_ENABLED = is_enabled
+            self.reaction_filter.rebuild()
             self._log_admin(msg_key="log_admin_enable_submission", user=ctx.author, value=strings.on_off(is_enabled))
         await ctx.reply(content=strings.get("commands_response_enable_submission").format(strings.on_off(config.SUBMISSION_ENABLED)))
 
@@ -391,6 +972,7 @@ class SCommands(Cog, name=config.COG_COMMANDS):
     async def cmd_enable_fishing(self, ctx: Context, is_enabled: bool = None) -> None:
         if is_enabled is not None:
             config.FISHING_ENABLED = is_enabled
+            self.reaction_filter.rebuild()
             self._log_admin(msg_key="log_admin_enable_fishing", user=ctx.author, value=strings.on_off(is_enabled))
         await ctx.reply(content=strings.get("commands_response_enable_fishing").format(strings.on_off(config.FISHING_ENABLED)))
 
@@ -433,6 +1015,32 @@ class SCommands(Cog, name=config.COG_COMMANDS):
         await self.bot.sync_guild(ctx.guild)
         await ctx.reply(content=strings.get("commands_response_sync"))
 
+    @commands.command(name=strings.get("command_name_backup"), hidden=True)
+    @commands.check(requires_admin)
+    async def cmd_backup(self, ctx: Context) -> None:
+        """
+        Saves a snapshot of the database alongside the database file, including all pending changes.
+        """
+        self._log_admin(msg_key="log_admin_backup", user=ctx.author)
+        await db.balances.flush()
+        path: Optional[str] = await db.backup_async()
+        msg: str = strings.get("commands_response_backup").format(os.path.basename(path)) \
+            if path \
+            else strings.get("commands_response_backup_unavailable")
+        await ctx.reply(content=msg)
+
+    @commands.command(name=strings.get("command_name_reaction_stats"), hidden=True)
+    @commands.check(requires_admin)
+    async def cmd_reaction_stats(self, ctx: Context) -> None:
+        """
+        Shows how many reactions were dropped or handled at each stage of the reaction filter.
+        """
+        msg: str = "\n".join([strings.get("commands_response_reaction_stats_format").format(
+            strings.get(f"reaction_stats_{stage}"),
+            self.reaction_filter.counts[stage])
+            for stage in SCommands.SReactionFilter.STAGES])
+        await ctx.reply(content=strings.get("commands_response_reaction_stats").format(msg))
+
     @commands.command(name=strings.get("command_name_reload"), aliases=["z"], hidden=True)
     @commands.check(requires_admin)
     async def cmd_reload(self, ctx: Context) -> None:
@@ -440,9 +1048,30 @@ class SCommands(Cog, name=config.COG_COMMANDS):
         Reloads the commands extension, reapplying code changes and reloading the strings data file.
         """
         self._log_admin(msg_key="log_admin_reload", user=ctx.author)
+        await db.balances.flush()
+        try:
+            await self.bot.reload_strings()
+        except (OSError, ValueError) as error:
+            await ctx.reply(content=strings.get("commands_response_strings_invalid").format(error))
+            return
         await self.bot.reload_extension(name=config.PACKAGE_COMMANDS)
         await ctx.message.add_reaction(strings.emoji_confirm)
 
+    @commands.command(name=strings.get("command_name_reload_strings"), hidden=True)
+    @commands.check(requires_admin)
+    async def cmd_reload_strings(self, ctx: Context) -> None:
+        """
+        Reloads the strings data file in place, without reloading commands.
+        """
+        self._log_admin(msg_key="log_admin_reload_strings", user=ctx.author)
+        msg: str
+        try:
+            await self.bot.reload_strings()
+            msg = strings.get("commands_response_strings")
+        except (OSError, ValueError) as error:
+            msg = strings.get("commands_response_strings_invalid").format(error)
+        await ctx.reply(content=msg)
+
     @commands.command(name=strings.get("command_name_test_string"), hidden=True)
     @commands.check(requires_admin)
     async def cmd_test_string(self, ctx: Context, string: str) -> None:
@@ -464,7 +1093,7 @@ class SCommands(Cog, name=config.COG_COMMANDS):
         :param ctx:
         """
         msg: str = "\n".join([strings.get("commands_response_test_emoji_format").format(
-            utils.get(self.bot.emojis, name=strings.get(e)),
+            get_emoji(bot=self.bot, name=strings.get(e)),
             strings.get(e),
             e)
             for e in strings.get("emoji_list")])
@@ -478,7 +1107,7 @@ class SCommands(Cog, name=config.COG_COMMANDS):
         :param ctx:
         """
         msg: str = "\n".join([strings.get("commands_response_test_roles_format").format(
-            utils.get(self.bot.emojis, name=strings.get(f"emoji_{rd.get('name')}")),
+            get_emoji(bot=self.bot, name=strings.get(f"emoji_{rd.get('name')}")),
             ctx.guild.get_role(rd.get("id")).mention,
             rd.get("name"),
             rd.get("cost"))
@@ -493,7 +1122,7 @@ class SCommands(Cog, name=config.COG_COMMANDS):
         :param ctx:
         """
         msg: str = "\n".join([strings.get("commands_response_test_fish_format").format(
-            key if len(key) == 1 else utils.get(self.bot.emojis, name=key),
+            key if len(key) == 1 else get_emoji(bot=self.bot, name=key),
             config.FISHING_SCOREBOARD[key])
             for key in config.FISHING_SCOREBOARD.keys()])
         await ctx.reply(content=strings.get("commands_response_test_fish").format(msg))
@@ -514,6 +1143,7 @@ class SCommands(Cog, name=config.COG_COMMANDS):
         channel: GuildChannel = query_channel(guild=ctx.guild, query=query)
         if content and isinstance(channel, TextChannel):
             message: Message = await channel.send(content=content)
+            remember_message(message=message)
             msg = strings.get("commands_response_send_success").format(
                 channel.mention,
                 message.jump_url)
@@ -573,7 +1203,7 @@ class SCommands(Cog, name=config.COG_COMMANDS):
         :param user_id: Discord user ID for a given user.
         """
 
-    def _do_strength(self, guild_id: int, user_id: int) -> SResponse:
+    async def _do_strength(self, guild_id: int, user_id: int) -> SResponse:
         """
         Generate a message for a strength-test scenario and add value to user's balance.
         :param user_id: Discord user ID for a given user.
@@ -589,7 +1219,7 @@ class SCommands(Cog, name=config.COG_COMMANDS):
         # Add value of outcome as a ratio of possible outcomes earned by this user to their balance
         balance_bonus: int = config.STRENGTH_BONUS_VALUE if is_weak or is_strong else 0
         balance_earned: int = outcome_value + balance_bonus
-        self._add_balance(guild_id=guild_id, user_id=user_id, value=balance_earned)
+        await self._add_balance(guild_id=guild_id, user_id=user_id, value=balance_earned, source=db.SOURCE_STRENGTH)
 
         response: str = strings.get("strength_response_format").format(
             strings.random("strength_responses_start"),
@@ -598,7 +1228,7 @@ class SCommands(Cog, name=config.COG_COMMANDS):
             strings.random("strength_responses_end"),
             outcomes[outcome_index]
         )
-        emoji: Emoji = utils.get(self.bot.emojis, name=strings.get("emoji_strength"))
+        emoji: Emoji = get_emoji(bot=self.bot, name=strings.get("emoji_strength"))
         msg: str = f"{emoji}\t{response}"
         if is_weak:
             msg += f"\n{strings.random('strength_responses_weak')}"
@@ -607,17 +1237,17 @@ class SCommands(Cog, name=config.COG_COMMANDS):
 
         return SCommands.SResponse(msg=msg, value=balance_earned)
 
-    def _do_wheel(self, guild_id: int, user_id: int, value: int, is_green: bool) -> SResponse:
+    async def _do_wheel(self, guild_id: int, user_id: int, value: int, is_green: bool) -> SResponse:
         random_range: int = 100
         random_result: int = random.randint(0, random_range)
         is_win: bool = random_result < random_range * config.WHEEL_WIN_CHANCE
 
         # Add or remove from the user's balance
         balance_earned: int = value * (1 if is_win else -1)
-        self._add_balance(guild_id=guild_id, user_id=user_id, value=balance_earned)
+        await self._add_balance(guild_id=guild_id, user_id=user_id, value=balance_earned, source=db.SOURCE_WHEEL)
 
         # Send a reply with the matching colour set for a win or loss
-        emoji: Emoji = utils.get(self.bot.emojis, name=strings.get("emoji_wheel"))
+        emoji: Emoji = get_emoji(bot=self.bot, name=strings.get("emoji_wheel"))
         response_start: str = f"{emoji}\t{strings.random('wheel_responses_start')}"
 
         # Losses will show the response as if the opposite set landed
@@ -631,13 +1261,13 @@ class SCommands(Cog, name=config.COG_COMMANDS):
 
         return SCommands.SResponse(msg=msg, value=balance_earned)
 
-    def _do_balance_get(self, author: User, user: User) -> SResponse:
+    async def _do_balance_get(self, author: User, user: User) -> SResponse:
         """
         Gets a user's balance.
         :param author: User checking balance.
         :param user: User to check.
         """
-        balance: int = db.get_balance_for(user_id=user.id)
+        balance: int = await db.balances.get(user_id=user.id)
         msg_balance_key: str = "balance_responses_other" if author.id != user.id \
             else "balance_responses_none" if balance < 1 \
             else "balance_responses_one" if balance == 1 \
@@ -645,48 +1275,119 @@ class SCommands(Cog, name=config.COG_COMMANDS):
         msg: str = strings.random(msg_balance_key).format(balance, user.mention)
         return SCommands.SResponse(msg=msg, value=balance)
 
-    def _do_balance_set(self, guild_id: int, user_from: User, user_to: User, value: int) -> SResponse:
+    async def _do_balance_set(self, guild_id: int, user_from: User, user_to: User, value: int) -> SResponse:
         """
         Sets balance for a user.
         :param user_from: User donating balance.
         :param user_to: User receiving donation.
         :param value: Value to be added to user's balance.
         """
-        balance_from: int = db.get_balance_for(user_id=user_from.id)
-        balance_donated: int = min(balance_from, value)
-        is_negative: bool = balance_donated < 1
-
         if user_from.id == user_to.id or value < 1:
             raise BadArgument()
-        elif is_negative:
+
+        # Move balance from self user to target user
+        balance_donated: int
+        balance_from: int
+        balance_to: int
+        async with user_locks.hold(user_from.id, user_to.id):
+            balance_donated, balance_from, balance_to = await db.balances.transfer(
+                from_id=user_from.id,
+                to_id=user_to.id,
+                amount=value,
+                guild_id=guild_id)
+        is_negative: bool = balance_donated < 1
+
+        if is_negative:
             value = 0
         else:
-            # Add balance to target user
-            self._add_balance(guild_id=guild_id, user_id=user_to.id, value=balance_donated)
-            # Deduct balance from self user
-            self._add_balance(guild_id=guild_id, user_id=user_from.id, value=-balance_donated)
+            self._add_earnings(guild_id=guild_id, value=balance_donated)
 
         msg_balance_key: str = "balance_responses_too_low" if is_negative else "balance_responses_donated"
-        msg: str = strings.random(msg_balance_key).format(balance_donated, balance_from, user_to.mention, db.get_balance_for(user_id=user_to.id))
+        msg: str = strings.random(msg_balance_key).format(balance_donated, balance_from, user_to.mention, balance_to)
         return SCommands.SResponse(msg=msg, value=value)
 
-    def _do_award(self, guild_id: int, user: User, value: int) -> SResponse:
+    async def _do_history(self, user: User, before_id: Optional[int]) -> SResponse:
+        """
+        Gets a page of a user's balance history, newest first.
+        :param user: User to check.
+        :param before_id: Ledger entry ID to show only older entries than, or none to start from the newest.
+        """
+        # Fetch one extra entry to check whether there's another page
+        entries: List[tuple] = await db.balances.get_ledger_for(
+            user_id=user.id,
+            limit=SCommands.HISTORY_PAGE_LEN + 1,
+            before_id=before_id)
+        # Entries not yet written have no ID, so older pages start from the newest entry written if none are shown
+        ids: List[int] = [entry[0] for entry in entries if entry[0] is not None]
+        before_id_more: Optional[int] = ids[0] + 1 if any(ids) else None
+        is_more: bool = len(entries) > SCommands.HISTORY_PAGE_LEN
+        entries = entries[:SCommands.HISTORY_PAGE_LEN]
+
+        msg: str
+        if not any(entries):
+            msg = strings.get("history_response_none").format(user.mention)
+        else:
+            msg_entries: str = "\n".join([strings.get("history_entry_format").format(
+                entry_id if entry_id is not None else strings.get("history_entry_pending"),
+                timestamp,
+                f"+{delta}" if delta >= 0 else delta,
+                strings.get(f"history_source_{source}"))
+                for entry_id, _, delta, source, timestamp in entries])
+            if entries[-1][0] is not None:
+                before_id_more = entries[-1][0]
+            msg = strings.get("history_response_format").format(user.mention, msg_entries)
+            if is_more and before_id_more is not None:
+                msg += "\n" + strings.get("history_response_more").format(
+                    config.COMMAND_PREFIX,
+                    strings.get("command_name_history"),
+                    user.id,
+                    before_id_more)
+        return SCommands.SResponse(msg=msg, value=0)
+
+    async def _do_leaderboard(self) -> SResponse:
+        """
+        Gets the users with the highest balances.
+        """
+        leaders: List[tuple] = await db.balances.top()
+        msg: str = strings.get("leaderboard_response_format").format("\n".join([
+            strings.get("leaderboard_entry_format").format(i + 1, f"<@{user_id}>", balance)
+            for i, (user_id, balance) in enumerate(leaders)])) \
+            if any(leaders) \
+            else strings.get("leaderboard_response_none")
+        return SCommands.SResponse(msg=msg, value=0)
+
+    async def _do_award_many(self, guild_id: int, members: List[Member], value: int) -> SResponse:
+        """
+        Adds a value to many users' balances in a single transaction.
+        :param members: Users receiving donation.
+        :param value: Value to be added to each user's balance.
+        """
+        await db.balances.add_many(
+            user_ids=[member.id for member in members],
+            delta=value,
+            source=db.SOURCE_AWARD,
+            guild_id=guild_id)
+
+        msg: str = strings.random("award_many_responses").format(len(members), value)
+        return SCommands.SResponse(msg=msg, value=value * len(members))
+
+    async def _do_award(self, guild_id: int, user: User, value: int) -> SResponse:
         """
         Adds a value to a user's balance.
         :param user: User receiving donation.
         :param value: Value to be added to user's balance.
         """
         # Add to user's balance
-        self._add_balance(guild_id=guild_id, user_id=user.id, value=value)
+        await self._add_balance(guild_id=guild_id, user_id=user.id, value=value, source=db.SOURCE_AWARD)
 
         msg: str = strings.random("award_responses").format(value, user.mention)
         return SCommands.SResponse(msg=msg, value=value)
 
     async def _do_update_shop(self, ctx: Context) -> str:
-        message_id: int = db.get_shop_message_id(guild_id=ctx.guild.id)
-        emoji: Emoji = utils.get(self.bot.emojis, name=strings.get("emoji_shop"))
+        message_id: int = await db.get_shop_message_id_async(guild_id=ctx.guild.id)
+        emoji: Emoji = get_emoji(bot=self.bot, name=strings.get("emoji_shop"))
         msg_roles: str = "\n".join([strings.get("message_shop_role").format(
-            utils.get(self.bot.emojis, name=strings.get(f"emoji_{role_data.get('name')}")),
+            get_emoji(bot=self.bot, name=strings.get(f"emoji_{role_data.get('name')}")),
             ctx.guild.get_role(role_data.get("id")).mention,
             role_data.get("cost")
         ) for role_data in config.SHOP_ROLE_LIST])
@@ -698,17 +1399,19 @@ class SCommands(Cog, name=config.COG_COMMANDS):
             title=shop_title,
             description=shop_body)
         embed.set_thumbnail(url=emoji.url)
-        view: View = SCommands.SShopView(guild=ctx.guild, bot=self.bot)
+        view: View = self._get_shop_view(guild=ctx.guild)
         channel: TextChannel = self.bot.get_channel(config.CHANNEL_SHOP)
         message: Message
         if message_id:
             message = await channel.get_partial_message(message_id).edit(content=None, embed=embed, view=view)
+            remember_message(message=message)
             msg = strings.get("commands_response_edit_success").format(
                 message.channel.mention,
                 message.jump_url)
         else:
             message = await channel.send(content=None, embed=embed, view=view)
-            db.set_shop_message_id(guild_id=ctx.guild.id, message_id=message.id)
+            remember_message(message=message)
+            await db.set_shop_message_id_async(guild_id=ctx.guild.id, message_id=message.id)
             msg = strings.get("commands_response_send_success").format(
                 channel.mention,
                 message.jump_url)
@@ -716,68 +1419,62 @@ class SCommands(Cog, name=config.COG_COMMANDS):
 
     # Event implementations
 
-    async def _do_verification(self, reaction: Reaction, user: User) -> Optional[str]:
+    async def _do_verification(self, message: Message, user: User) -> Optional[str]:
         """
         Staff reactions to posts with attachments in the submissions channel will add to the author's balance.
-        :param reaction: Reaction instance for a given emoji on the message.
+        Reactions are checked to be from staff in the submissions channels by the reaction filter beforehand.
+        :param message: Message reacted to.
         :param user: User reacting to the message.
         """
-        if check_roles(user=user, role_ids=[ROLE_ADMIN, ROLE_HELPER]) \
-                and reaction.message.id not in self.submission_session:
-            if any(reaction.message.attachments) or any(reaction.message.embeds):
-                self.submission_session.append(reaction.message.id)
-                is_art: bool = reaction.message.channel.id == config.CHANNEL_ART
+        # Check verified submissions to prevent multiple staff reactions adding to the author's balance again
+        if message.id not in db.submissions and not message.author.bot:
+            if (any(message.attachments) or any(message.embeds)) \
+                    and await db.submissions.claim(message_id=message.id):
+                self.messages.discard(message_id=message.id)
+                is_art: bool = message.channel.id == config.CHANNEL_ART
                 balance_earned: int = config.SUBMISSION_ART_VALUE if is_art else config.SUBMISSION_FOOD_VALUE
-                self._add_balance(guild_id=reaction.message.guild.id, user_id=reaction.message.author.id, value=balance_earned)
+                # Record the submission as verified in the same transaction as its payout
+                await db.balances.add(
+                    user_id=message.author.id,
+                    delta=balance_earned,
+                    source=db.SOURCE_SUBMISSION,
+                    guild_id=message.guild.id,
+                    submission_id=message.id)
+                self._add_earnings(guild_id=message.guild.id, value=balance_earned)
                 msg_key: str = "submission_responses_art" if is_art else "submission_responses_food"
                 msg: str = strings.random(msg_key).format(balance_earned)
                 return msg
 
-    async def _do_fishing(self, reaction: Reaction, user: User) -> Optional[SResponse]:
+    async def _do_fishing(self, guild_id: int, message_id: int, user: User, time_now: datetime.datetime,
+                          catch: SCatchRegistry.SCatch) -> Optional[SResponse]:
         """
         Adds to a user's balance some value based on the fish emoji in a message they reacted to.
-        :param reaction: Reaction instance for a given emoji on the message.
+        :param guild_id: Discord guild ID for the guild containing the message.
+        :param message_id: Discord message ID for the message reacted to.
         :param user: User reacting to the message.
+        :param time_now: Time the reaction was added.
+        :param catch: Fish caught in the message, as scored when it was sent.
         """
-        # Check fishing session to prevent users adding multiple reactions to the same message to cheat their balance
-        fishing_user: List[int] = self.fishing_session.get(user.id, [])
-        if reaction.message.id in fishing_user:
+        time_msg: datetime.datetime = utils.snowflake_time(message_id)
+
+        # Check and save interaction to fishing session to prevent users adding multiple reactions to the same message
+        # to cheat their balance
+        if not self.fishing_session.add(user_id=user.id, message_id=message_id, time_msg=time_msg, time_now=time_now):
             return
 
         msg: str
         balance_earned: int = 0
         balance_bonus: int = 0
 
-        # Save interaction to fishing session
-        fishing_user.append(reaction.message.id)
-        self.fishing_session[user.id] = fishing_user
-
         # Sum the value of fish caught in this message
-        fish_counts: Dict[str, int] = {
-            fish: reaction.message.content.count(fish)
-            for fish in FISHING_SCOREBOARD.keys()
-        }
-        fish_scores: Dict[str, int] = {
-            fish: FISHING_SCOREBOARD[fish] * fish_counts[fish]
-            for fish in fish_counts.keys()
-        }
-        fish_value: int = sum(fish_scores.values())
+        fish_counts: Dict[str, int] = catch.counts
+        fish_value: int = catch.value
         is_catch: bool = fish_value > 0
 
-        # Ignore the catch if message had no fish emoji
-        if all(value == 0 for value in fish_scores.values()):
-            return
-
-        # Check if catch period has expired, converting to timezone-unaware times
-        time_now = datetime.datetime.now(tz=datetime.timezone.utc)
-        time_msg = reaction.message.created_at
-        time_period = datetime.timedelta(seconds=config.FISHING_DURATION_SECONDS)
-        time_delta = time_now - time_msg
-
         if not is_catch:
             # Abandon a valueless catch
             msg = strings.random("fishing_responses_none")
-        elif time_delta > time_period:
+        elif time_now > catch.expiry:
             # Abandon a valuable catch if the catch period has expired
             msg = strings.random("fishing_responses_timeout")
         else:
@@ -787,7 +1484,11 @@ class SCommands(Cog, name=config.COG_COMMANDS):
             if random_result < FISHING_BONUS_CHANCE * random_range:
                 balance_bonus = FISHING_BONUS_VALUE
             balance_earned = fish_value + balance_bonus
-            self._add_balance(guild_id=reaction.message.guild.id, user_id=user.id, value=balance_earned)
+            await self._add_balance(
+                guild_id=guild_id,
+                user_id=user.id,
+                value=balance_earned,
+                source=db.SOURCE_FISHING)
 
             # Generate a reply message based on number or value of fish caught
             response_key: str = "fishing_responses_value" if fish_value >= FISHING_HIGH_VALUE \
@@ -796,13 +1497,13 @@ class SCommands(Cog, name=config.COG_COMMANDS):
             msg = strings.get("fishing_response_format").format(
                 strings.random(response_key),
                 strings.random("fishing_responses_summary"),
-                " ".join([fish_counts[fish] * (fish if len(fish) == 1 else str(utils.get(self.bot.emojis, name=fish)))
+                " ".join([fish_counts[fish] * (fish if len(fish) == 1 else str(get_emoji(bot=self.bot, name=fish)))
                           for fish in fish_counts
                           if fish_counts[fish] > 0]))
             if balance_bonus > 0:
                 msg += f"\n{strings.random('fishing_responses_bonus')}"
 
-        emoji: Emoji = utils.get(self.bot.emojis, name=strings.get("emoji_fishing"))
+        emoji: Emoji = get_emoji(bot=self.bot, name=strings.get("emoji_fishing"))
         msg = f"{emoji}{user.mention}\t{msg}"
         response: SCommands.SResponse = SCommands.SResponse(msg=msg, value=balance_earned)
 
@@ -828,15 +1529,21 @@ class SCommands(Cog, name=config.COG_COMMANDS):
         if chars and all([not chars.startswith(s) for s in ["why", "who", "what", "where", "how"]]):
             # We skip the usual strings random call to use a random seeded by the question
             response: str = random.Random(chars).choice(strings.get("fortune_responses"))
-            emoji: Emoji = utils.get(self.bot.emojis, name=strings.get("emoji_fortune"))
+            emoji: Emoji = get_emoji(bot=self.bot, name=strings.get("emoji_fortune"))
             msg = f"{emoji}\t{response}"
             response = SCommands.SResponse(msg=msg, value=0)
         return response
 
     # Event listeners
 
+    async def on_ready(self) -> None:
+        await self._register_shop_views()
+
     async def on_message(self, message: Message) -> None:
         if message.author.bot:
+            # Drop reactions to bot messages in submission channels without fetching them
+            if message.channel.id in self.reaction_filter.submission_channels:
+                self.reaction_filter.add_bot_message(message_id=message.id)
             return
 
         # Do bot responses on user messages in command channels
@@ -845,27 +1552,78 @@ class SCommands(Cog, name=config.COG_COMMANDS):
             if response:
                 await message.reply(content=response.msg)
 
-    async def on_reaction_add(self, reaction: Reaction, user: User) -> None:
-        if reaction.message.author.bot or user.bot:
-            return
+        # Score fishing catches on staff messages in any channels
+        if check_roles(user=message.author, role_ids=[ROLE_ADMIN, ROLE_HELPER]):
+            self.fishing_catches.add(message=message)
+
+        # Keep submissions to be verified by staff reactions
+        if message.channel.id in self.reaction_filter.submission_channels \
+                and (any(message.attachments) or any(message.embeds)):
+            self.messages.add(message=message)
+
+    async def on_raw_message_edit(self, payload: RawMessageUpdateEvent) -> None:
+        # Score fishing catches again on staff messages edited while they can be caught
+        content: Optional[str] = payload.data.get("content")
+        if content is not None:
+            self.fishing_catches.update(
+                message_id=payload.message_id,
+                content=content,
+                time_now=datetime.datetime.now(tz=datetime.timezone.utc))
+
+    async def on_raw_reaction_add(self, payload: RawReactionActionEvent) -> None:
+        time_now: datetime.datetime = datetime.datetime.now(tz=datetime.timezone.utc)
+        is_submission: bool
+        is_fishing: bool
+        is_submission, is_fishing = self.reaction_filter.check(payload=payload, time_now=time_now)
+
+        # Skip fetching submissions already verified, unless they're kept as pending
+        if is_submission and payload.message_id not in self.messages \
+                and await db.submissions.is_verified(message_id=payload.message_id):
+            is_submission = False
 
         # Do staff verification on user messages in submission channels
-        if config.SUBMISSION_ENABLED and reaction.message.channel.id in [config.CHANNEL_ART, config.CHANNEL_FOOD]:
-            msg: str = await self._do_verification(reaction=reaction, user=user)
+        if is_submission:
+            message: Optional[Message] = await self.messages.fetch(
+                channel_id=payload.channel_id,
+                message_id=payload.message_id,
+                is_cached=False)
+            msg: Optional[str] = None
+            if not message:
+                self.reaction_filter.counts["dropped_missing"] += 1
+            else:
+                # Only keep fetched messages that could be verified
+                if not message.author.bot and (any(message.attachments) or any(message.embeds)):
+                    self.messages.add(message=message)
+                msg = await self._do_verification(message=message, user=payload.member)
             if msg:
-                await reaction.message.add_reaction(strings.emoji_confirm)
-                emoji: Emoji = utils.get(self.bot.emojis, name=strings.get("emoji_submissions"))
+                await message.add_reaction(strings.emoji_confirm)
+                emoji: Emoji = get_emoji(bot=self.bot, name=strings.get("emoji_submissions"))
                 msg = f"{emoji}\t{msg}"
-                await reaction.message.reply(content=msg)
+                await message.reply(content=msg)
 
         # Do fishing responses on staff messages in any channels
-        if config.FISHING_ENABLED and check_roles(user=reaction.message.author, role_ids=[ROLE_ADMIN, ROLE_HELPER]):
-            response: Optional[SCommands.SResponse] = await self._do_fishing(reaction=reaction, user=user)
+        catch: Optional[SCommands.SCatchRegistry.SCatch] = None
+        if is_fishing:
+            catch = self.fishing_catches.get(message_id=payload.message_id, time_now=time_now)
+            if not catch and self.fishing_catches.is_missed(message_id=payload.message_id, time_now=time_now):
+                # Check messages sent before the session began once each
+                catch = self.fishing_catches.add_missed(
+                    message_id=payload.message_id,
+                    message=await self.messages.fetch(
+                        channel_id=payload.channel_id,
+                        message_id=payload.message_id,
+                        is_cached=False))
+        if catch:
+            response: Optional[SCommands.SResponse] = await self._do_fishing(
+                guild_id=payload.guild_id,
+                message_id=payload.message_id,
+                user=payload.member,
+                time_now=time_now,
+                catch=catch)
             if response:
-                channel: TextChannel = self.bot.get_channel(config.CHANNEL_FISHING)
                 if response.value > 0:
                     response.msg += f"\n{strings.random('balance_responses_added').format(response.value)}"
-                await channel.send(content=response.msg, allowed_mentions=AllowedMentions(users=True))
+                self.fishing_announcer.add(msg=response.msg)
 
     async def on_command_error(self, ctx: Context, error: Exception) -> None:
         msg: str = None
@@ -883,7 +1641,7 @@ class SCommands(Cog, name=config.COG_COMMANDS):
             if isinstance(error, MissingRequiredArgument):
                 msg = strings.random(f"{cmd_internal_name}_responses_params")
             emoji_name: str = strings.get(f"emoji_{cmd_internal_name}")
-            emoji: Emoji = utils.get(self.bot.emojis, name=emoji_name)
+            emoji: Emoji = get_emoji(bot=self.bot, name=emoji_name)
             if msg and emoji:
                 msg = f"{emoji}\t{msg}"
         if msg:
@@ -899,11 +1657,15 @@ async def setup(bot: Bot):
     await bot.add_cog(cog)
 
     # Add event listeners
+    bot.add_listener(cog.on_ready, name="on_ready")
     bot.add_listener(cog.on_message, name="on_message")
-    bot.add_listener(cog.on_reaction_add, name="on_reaction_add")
+    bot.add_listener(cog.on_raw_message_edit, name="on_raw_message_edit")
+    bot.add_listener(cog.on_raw_reaction_add, name="on_raw_reaction_add")
     bot.add_listener(cog.on_command_error, name="on_command_error")
 
-    # Load data
-    bot.reload_strings()
-    reload(strings)
-    reload(utils)
+    # Format help for all commands
+    index_help(bot=bot)
+
+    # Replace shop views registered before reloading commands
+    if bot.is_ready():
+        await cog._register_shop_views()
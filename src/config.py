@@ -3,7 +3,7 @@
 # Written by blueberry et al., 2022
 # https://github.com/StardewValleyDiscord/SDVAutumn2022
 
-from typing import List, Dict
+from typing import List, Dict, FrozenSet
 
 import discord
 import json
@@ -14,6 +14,8 @@ Contents:
     Bot
     Tokens
     Discord
+    Database
+    Backups
     Balance
     Fishing challenge
     Fortune teller
@@ -27,6 +29,8 @@ PATH_CONFIG: str = "./private/config-bb.json"
 PATH_DATABASE: str = "./private/autumn-bb.db"
 """Relative path to database file used to store usage history."""
 PATH_STRINGS: str = "./assets/strings.json"
+STRINGS_WATCH_SECONDS: float = 5
+"""Interval between checks for changes to the strings data file, which are then reloaded."""
 PATH_LOG: str = "./private/discord.log"
 
 # Parse config file
@@ -51,6 +55,7 @@ TOKEN_DISCORD: str = cfg["discord"]
 
 DISCORD_INTENTS: discord.Intents = discord.Intents(
     guilds=True,
+    members=True,
     guild_messages=True,
     guild_reactions=True,
     message_content=True,
@@ -61,6 +66,16 @@ EXTENSIONS: List[str] = cfg["extensions"]
 """List of extensions to load on bot init."""
 COMMAND_PREFIX: str = cfg["command_prefix"]
 """Prefix required for all messages sent in command channel."""
+MESSAGE_CACHE_SIZE: int = cfg["message_cache_size"]
+"""Maximum number of submission messages kept in memory to handle reactions, fetching any others as needed."""
+MESSAGE_LOCATION_CACHE_SIZE: int = 1000
+"""Maximum number of message IDs kept with the IDs of channels containing them, for finding messages by ID."""
+MEMBER_ROLES_CACHE_SIZE: int = 1000
+"""Maximum number of members kept with the IDs of their roles, for checking roles on messages and reactions."""
+SUBMISSION_CACHE_SIZE: int = 1000
+"""Maximum number of verified submission message IDs kept in memory, checking the database for any others."""
+MESSAGE_SEARCH_CONCURRENCY: int = 8
+"""Maximum number of channels queried at once when finding messages by ID."""
 
 ROLE_EVENT: int = cfg["roles"]["event"]
 ROLE_HELPER: int = cfg["roles"]["helper"]
@@ -74,9 +89,44 @@ CHANNEL_FOOD: int = cfg["channels"]["food"]
 CHANNEL_FISHING: int = cfg["channels"]["fishing"]
 CHANNEL_ROLES: List[int] = cfg["channels"]["roles"]
 
+# Database
+
+DATABASE_BACKEND: str = cfg["database"]["backend"]
+"""Storage used for the database: "file" for the database file, "memory" for a shared-cache in-memory SQLite database,
+or "dict" for dictionaries without SQLite, where in-memory storage is only suitable for tests and benchmarks."""
+DATABASE_SYNCHRONOUS: str = cfg["database"]["synchronous"]
+"""SQLite synchronous pragma applied to all connections, e.g. NORMAL when journaling with WAL."""
+DATABASE_CACHE_SIZE: int = cfg["database"]["cache_size"]
+"""SQLite page cache size per connection, in pages if positive or in kibibytes if negative."""
+DATABASE_MMAP_SIZE: int = cfg["database"]["mmap_size"]
+"""Maximum number of bytes of the database file to memory-map per connection."""
+DATABASE_STATEMENT_CACHE_SIZE: int = cfg["database"]["statement_cache_size"]
+"""Number of prepared statements cached per connection."""
+DATABASE_READ_WORKERS: int = cfg["database"]["read_workers"]
+"""Number of worker threads serving concurrent database reads for async queries."""
+
+# Backups
+
+BACKUP_INTERVAL_HOURS: float = cfg["backup"]["interval_hours"]
+"""Interval between scheduled database backups."""
+BACKUP_COUNT: int = cfg["backup"]["count"]
+"""Number of database backups kept before removing the oldest."""
+if BACKUP_COUNT < 1:
+    raise ValueError("Backup count must keep at least 1 backup.")
+BACKUP_PAGES: int = cfg["backup"]["pages"]
+"""Number of database pages copied in each step of a backup."""
+BACKUP_SLEEP_SECONDS: float = cfg["backup"]["sleep_seconds"]
+"""Time to wait between each step of a backup."""
+
 # Balance
 
 STARTING_BALANCE: int = cfg["balance"]["starting_balance"]
+BALANCE_CACHE_SIZE: int = cfg["balance"]["cache_size"]
+"""Number of user balances kept in memory."""
+BALANCE_FLUSH_SECONDS: float = cfg["balance"]["flush_seconds"]
+"""Interval between writing changes to user balances from memory to the database."""
+LEADERBOARD_SIZE: int = cfg["balance"]["leaderboard_size"]
+"""Number of users shown on the balance leaderboard."""
 
 # Submissions
 
@@ -92,6 +142,8 @@ FISHING_BONUS_VALUE: int = cfg["fishing"]["bonus_value"]
 FISHING_HIGH_VALUE: int = cfg["fishing"]["high_value"]
 FISHING_DURATION_SECONDS: int = cfg["fishing"]["duration_seconds"]
 FISHING_SCOREBOARD: Dict[str, int] = cfg["fishing"]["scoreboard"]
+FISHING_ANNOUNCE_SECONDS: float = cfg["fishing"]["announce_seconds"]
+"""Number of seconds fish caught are collected for before being announced together in the fishing channel."""
 
 # Fortune teller
 
@@ -122,4 +174,8 @@ CRYSTALBALL_ENABLED: bool = cfg["crystalball"]["enabled"]
 # Shop
 
 SHOP_ROLE_LIST: List[dict] = sorted(cfg["shop"]["role_list"], key=lambda rd: rd.get("cost"))
+SHOP_ROLES: Dict[str, dict] = {rd.get("name"): rd for rd in SHOP_ROLE_LIST}
+"""Map of shop role names, used as shop button IDs, to role data for each shop role."""
+SHOP_ROLE_IDS: FrozenSet[int] = frozenset(rd.get("id") for rd in SHOP_ROLE_LIST)
+"""Discord role IDs for all shop roles."""
 
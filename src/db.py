@@ -3,11 +3,25 @@
 # Written by blueberry et al., 2022
 # https://github.com/StardewValleyDiscord/SDVAutumn2022
 
+import asyncio
+import bisect
+import functools
+import glob
+import heapq
+import os
 import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from sqlite3 import Connection
-from typing import List, Tuple, Optional
+from typing import List, Tuple, Optional, Callable, Any, Dict
 
-from config import PATH_DATABASE, STARTING_BALANCE
+from config import PATH_DATABASE, STARTING_BALANCE, DATABASE_SYNCHRONOUS, DATABASE_CACHE_SIZE, DATABASE_MMAP_SIZE, \
+    DATABASE_STATEMENT_CACHE_SIZE, DATABASE_READ_WORKERS, BALANCE_CACHE_SIZE, LEADERBOARD_SIZE, BACKUP_COUNT, \
+    BACKUP_PAGES, BACKUP_SLEEP_SECONDS, DATABASE_BACKEND, SUBMISSION_CACHE_SIZE
 
 
 # Constant values
@@ -23,48 +37,681 @@ KEY_GUILD_EARNED: str = "EARNED"
 TABLE_USERS: str = "USERS"
 KEY_USER_ID: str = "ID"
 KEY_USER_BALANCE: str = "BALANCE"
+INDEX_USER_BALANCE: str = "USERS_BALANCE"
+
+# Ledger entries
+TABLE_LEDGER: str = "LEDGER"
+KEY_LEDGER_ID: str = "ID"
+KEY_LEDGER_USER_ID: str = "USER_ID"
+KEY_LEDGER_GUILD_ID: str = "GUILD_ID"
+KEY_LEDGER_DELTA: str = "DELTA"
+KEY_LEDGER_SOURCE: str = "SOURCE"
+KEY_LEDGER_TIMESTAMP: str = "TIMESTAMP"
+INDEX_LEDGER_USER: str = "LEDGER_USER"
+
+# Submission entries
+TABLE_SUBMISSIONS: str = "SUBMISSIONS"
+KEY_SUBMISSION_ID: str = "ID"
+KEY_SUBMISSION_USER_ID: str = "USER_ID"
+KEY_SUBMISSION_TIMESTAMP: str = "TIMESTAMP"
+
+# Ledger sources
+SOURCE_WHEEL: str = "wheel"
+SOURCE_STRENGTH: str = "strength"
+SOURCE_FISHING: str = "fishing"
+SOURCE_SUBMISSION: str = "submission"
+SOURCE_AWARD: str = "award"
+SOURCE_SHOP: str = "shop"
+SOURCE_DONATION: str = "donation"
+
+
+# Connection management
+
+
+class _ConnectionPool:
+    """
+    Long-lived database connections shared by all queries.
+
+    A single writer connection is serialised behind a lock, and each thread reading from the database reuses
+    its own read-only connection, so queries no longer pay to open the file and parse the schema each time.
+    """
+
+    def __init__(self, path: str, is_memory: bool = False):
+        self.path: str = path
+        """Path to database file, or URI for shared-cache in-memory databases."""
+        self.is_memory: bool = is_memory
+        """Whether the database is a shared-cache in-memory database, lasting only while any connection is open."""
+        self._writer: Optional[Connection] = None
+        self._writer_lock: threading.RLock = threading.RLock()
+        self._readers: threading.local = threading.local()
+        self._reader_list: List[Connection] = []
+        self._reader_list_lock: threading.Lock = threading.Lock()
+
+    def _connect(self, is_writer: bool) -> Connection:
+        # Connections are shared between threads by the writer lock or thread-local readers, and closed from any thread
+        conn: Connection = sqlite3.connect(
+            self.path,
+            check_same_thread=False,
+            cached_statements=DATABASE_STATEMENT_CACHE_SIZE,
+            uri=self.is_memory)
+        if self.is_memory:
+            # Shared-cache connections lock tables against each other, so readers skip waiting on the writer
+            if not is_writer:
+                conn.execute("PRAGMA read_uncommitted=ON")
+        elif is_writer:
+            # Journal mode is persistent in the database file, so only needs setting by the writer
+            conn.execute("PRAGMA journal_mode=WAL")
+        if not is_writer:
+            conn.execute("PRAGMA query_only=ON")
+        conn.execute(f"PRAGMA synchronous={DATABASE_SYNCHRONOUS}")
+        conn.execute(f"PRAGMA cache_size={int(DATABASE_CACHE_SIZE)}")
+        conn.execute(f"PRAGMA mmap_size={int(DATABASE_MMAP_SIZE)}")
+        return conn
+
+    def writer(self) -> Connection:
+        """
+        Gets the writer connection. Callers must hold the writer lock while using it.
+        """
+        if not self._writer:
+            self._writer = self._connect(is_writer=True)
+        return self._writer
+
+    def writer_lock(self) -> threading.RLock:
+        return self._writer_lock
+
+    def connect_reader(self) -> Connection:
+        """
+        Opens a new read-only connection outside of the pool, to be closed by the caller.
+        """
+        return self._connect(is_writer=False)
+
+    def reader(self) -> Connection:
+        """
+        Gets the read-only connection for the current thread, opening it on first use.
+        """
+        conn: Optional[Connection] = getattr(self._readers, "conn", None)
+        if not conn:
+            conn = self._connect(is_writer=False)
+            self._readers.conn = conn
+            with self._reader_list_lock:
+                self._reader_list.append(conn)
+        return conn
+
+    def close(self) -> None:
+        """
+        Closes all open connections. Connections are reopened on next use.
+        """
+        with self._writer_lock:
+            if self._writer:
+                self._writer.close()
+                self._writer = None
+        with self._reader_list_lock:
+            for conn in self._reader_list:
+                conn.close()
+            self._reader_list.clear()
+        self._readers = threading.local()
+
+
+# Storage backends
+
+
+class StorageBackend(ABC):
+    """
+    Base for storage used by all database queries.
+
+    Module-level queries are forwarded to the current backend, selected in the config file,
+    so the same code paths can be run against the database file or a throwaway store.
+    """
+
+    @abstractmethod
+    def setup(self) -> None:
+        ...
+
+    @abstractmethod
+    def close(self) -> None:
+        ...
+
+    def backup(self) -> Optional[str]:
+        """
+        Saves a snapshot of all stored values, if supported by the backend.
+        :returns: Path to the new snapshot file, or none if the backend doesn't save snapshots.
+        """
+        return None
+
+    @abstractmethod
+    def get_guild_earnings(self, guild_id: int) -> int:
+        ...
+
+    @abstractmethod
+    def set_guild_earnings(self, guild_id: int, value: int) -> int:
+        ...
+
+    @abstractmethod
+    def add_guild_earnings(self, guild_id: int, delta: int) -> int:
+        ...
+
+    @abstractmethod
+    def get_shop_message_id(self, guild_id: int) -> Optional[int]:
+        ...
+
+    @abstractmethod
+    def set_shop_message_id(self, guild_id: int, message_id: int) -> None:
+        ...
+
+    @abstractmethod
+    def get_balance_for(self, user_id: int) -> int:
+        ...
+
+    @abstractmethod
+    def get_balances_for(self, user_ids: List[int]) -> Dict[int, int]:
+        ...
+
+    @abstractmethod
+    def get_top_balances(self, limit: int) -> List[Tuple[int, int]]:
+        ...
+
+    @abstractmethod
+    def set_balance_for(self, user_id: int, value: int) -> int:
+        ...
+
+    @abstractmethod
+    def add_balance(self, user_id: int, delta: int, source: str, guild_id: Optional[int]) -> int:
+        ...
+
+    @abstractmethod
+    def add_balances(self, deltas: List[Tuple[int, int]], ledger: List[tuple], earnings: List[Tuple[int, int]],
+                     submissions: List[tuple]) -> None:
+        ...
+
+    @abstractmethod
+    def transfer(self, from_id: int, to_id: int, amount: int, guild_id: Optional[int]) -> Tuple[int, int, int]:
+        ...
+
+    @abstractmethod
+    def get_ledger_for(self, user_id: int, limit: int, before_id: Optional[int]) -> List[tuple]:
+        ...
+
+    @abstractmethod
+    def get_submission_ids(self, limit: int) -> List[int]:
+        ...
+
+    @abstractmethod
+    def has_submission(self, message_id: int) -> bool:
+        ...
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Storage backend using an SQLite database, either from a file or held in memory with a shared cache.
+    """
+
+    def __init__(self, path: str, is_memory: bool = False):
+        self._pool: _ConnectionPool = _ConnectionPool(path=path, is_memory=is_memory)
+        """Connections used for all database queries."""
+
+    def _db_read(self, _query: [tuple, str]) -> any:
+        """
+        Helper function to perform database reads.
+        """
+        sqlconn: Connection = self._pool.reader()
+        results: any
+        if isinstance(_query, tuple):
+            results = sqlconn.execute(*_query).fetchall()
+        else:
+            results = sqlconn.execute(_query).fetchone()
+        return results
+
+    def _db_write(self, _query: [Tuple[str, list], str]) -> list:
+        """
+        Helper function to perform database writes.
+        :returns: Rows returned by the query, if any.
+        """
+        return self._db_transaction(lambda sqlconn: (sqlconn.execute(*_query) if isinstance(_query, tuple)
+                                                     else sqlconn.execute(_query)).fetchall())
+
+    def _db_transaction(self, func: Callable[[Connection], Any]) -> Any:
+        """
+        Helper function to perform several database reads and writes in a single transaction.
+        :param func: Function given the writer connection to run all queries in the transaction with.
+        :returns: Value returned by the function.
+        """
+        with self._pool.writer_lock():
+            sqlconn: Connection = self._pool.writer()
+            try:
+                sqlconn.execute("BEGIN IMMEDIATE")
+                results: Any = func(sqlconn)
+                sqlconn.commit()
+                return results
+            except BaseException:
+                sqlconn.rollback()
+                raise
+
+    # Utility methods
+
+    def setup(self) -> None:
+        queries: List[str] = [
+            # Global values
+            f"CREATE TABLE IF NOT EXISTS {TABLE_GUILDS} ({KEY_GUILD_ID} INT PRIMARY KEY, {KEY_GUILD_SHOP_ID} INT, {KEY_GUILD_EARNED} INT)",
+            # User values
+            f"CREATE TABLE IF NOT EXISTS {TABLE_USERS} ({KEY_USER_ID} INT PRIMARY KEY, {KEY_USER_BALANCE} INT)",
+            f"CREATE INDEX IF NOT EXISTS {INDEX_USER_BALANCE} ON {TABLE_USERS} ({KEY_USER_BALANCE})",
+            # Balance history
+            f"CREATE TABLE IF NOT EXISTS {TABLE_LEDGER} ({KEY_LEDGER_ID} INTEGER PRIMARY KEY, {KEY_LEDGER_USER_ID} INT NOT NULL,"
+            f" {KEY_LEDGER_GUILD_ID} INT, {KEY_LEDGER_DELTA} INT NOT NULL, {KEY_LEDGER_SOURCE} TEXT NOT NULL,"
+            f" {KEY_LEDGER_TIMESTAMP} INT NOT NULL)",
+            f"CREATE INDEX IF NOT EXISTS {INDEX_LEDGER_USER} ON {TABLE_LEDGER} ({KEY_LEDGER_USER_ID}, {KEY_LEDGER_ID})",
+            # Verified submissions
+            f"CREATE TABLE IF NOT EXISTS {TABLE_SUBMISSIONS} ({KEY_SUBMISSION_ID} INT PRIMARY KEY, {KEY_SUBMISSION_USER_ID} INT,"
+            f" {KEY_SUBMISSION_TIMESTAMP} INT NOT NULL)"
+        ]
+        with self._pool.writer_lock():
+            db: Connection = self._pool.writer()
+            for query in queries:
+                db.execute(query)
+            db.commit()
+
+    def close(self) -> None:
+        self._pool.close()
+
+    def backup(self) -> Optional[str]:
+        # Snapshots are saved next to the database file, so in-memory databases never replace them
+        if self._pool.is_memory:
+            return None
+        # Backups run one at a time on their own thread, so timestamps to the microsecond never share a name
+        path: str = f"{PATH_DATABASE}.{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}.bak"
+        path_temp: str = f"{path}.tmp"
+        source: Connection = self._pool.connect_reader()
+        target: Connection = sqlite3.connect(path_temp)
+        is_complete: bool = False
+        try:
+            # Hold a read transaction for the whole backup, so each step copies from the same snapshot, and changes
+            # committed by the writer in the meantime never restart the backup nor wait for it
+            source.execute("BEGIN")
+            source.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+            # Backups only sleep between steps when busy, so instead wait after each step to yield disk time
+            source.backup(target, pages=BACKUP_PAGES, progress=lambda status, remaining, total: time.sleep(BACKUP_SLEEP_SECONDS))
+            is_complete = True
+        finally:
+            source.close()
+            target.close()
+            if not is_complete:
+                os.remove(path_temp)
+        os.replace(path_temp, path)
+
+        # Remove oldest snapshots, which sort first by timestamp
+        for path_old in sorted(glob.glob(f"{glob.escape(PATH_DATABASE)}.*.bak"))[:-BACKUP_COUNT]:
+            os.remove(path_old)
+        return path
+
+    # Guild queries
+
+    def get_guild_earnings(self, guild_id: int) -> int:
+        query: tuple = (f"SELECT {KEY_GUILD_EARNED} FROM {TABLE_GUILDS} WHERE {KEY_GUILD_ID}=?", [guild_id])
+        guild = self._db_read(query)
+        return guild[0][0] if guild and guild[0] and guild[0][0] else 0
+
+    def set_guild_earnings(self, guild_id: int, value: int) -> int:
+        query: tuple = (f"INSERT INTO {TABLE_GUILDS} ({KEY_GUILD_ID}, {KEY_GUILD_EARNED}) VALUES (?, ?)"
+                        f" ON CONFLICT({KEY_GUILD_ID}) DO UPDATE SET {KEY_GUILD_EARNED}=excluded.{KEY_GUILD_EARNED}"
+                        f" RETURNING {KEY_GUILD_EARNED}", [guild_id, value])
+        guild = self._db_write(query)
+        return guild[0][0] if guild and guild[0] and guild[0][0] else 0
+
+    @staticmethod
+    def _add_guild_earnings_query(guild_id: int, delta: int, is_returning: bool = True) -> tuple:
+        return (f"INSERT INTO {TABLE_GUILDS} ({KEY_GUILD_ID}, {KEY_GUILD_EARNED}) VALUES (?, ?)"
+                f" ON CONFLICT({KEY_GUILD_ID}) DO UPDATE SET {KEY_GUILD_EARNED}=IFNULL({KEY_GUILD_EARNED}, 0)+excluded.{KEY_GUILD_EARNED}"
+                + (f" RETURNING {KEY_GUILD_EARNED}" if is_returning else ""),
+                [guild_id, delta])
+
+    def add_guild_earnings(self, guild_id: int, delta: int) -> int:
+        guild = self._db_write(self._add_guild_earnings_query(guild_id=guild_id, delta=delta))
+        return guild[0][0] if guild and guild[0] and guild[0][0] else 0
+
+    def get_shop_message_id(self, guild_id: int) -> Optional[int]:
+        query: tuple = (f"SELECT {KEY_GUILD_SHOP_ID} FROM {TABLE_GUILDS} WHERE {KEY_GUILD_ID}=?", [guild_id])
+        found_id = self._db_read(query)
+        return found_id[0][0] if found_id and found_id[0] else None
+
+    def set_shop_message_id(self, guild_id: int, message_id: int) -> None:
+        query: tuple = (f"INSERT INTO {TABLE_GUILDS} ({KEY_GUILD_ID}, {KEY_GUILD_SHOP_ID}) VALUES (?, ?)"
+                        f" ON CONFLICT({KEY_GUILD_ID}) DO UPDATE SET {KEY_GUILD_SHOP_ID}=excluded.{KEY_GUILD_SHOP_ID}",
+                        [guild_id, message_id])
+        self._db_write(query)
+
+    # User queries
+
+    def get_balance_for(self, user_id: int) -> int:
+        query: tuple = (f"SELECT {KEY_USER_BALANCE} FROM {TABLE_USERS} WHERE {KEY_USER_ID}=?", [user_id])
+        user = self._db_read(query)
+
+        if not user:
+            return STARTING_BALANCE
+        else:
+            return user[0][0] if user and user[0] else None
+
+    def get_balances_for(self, user_ids: List[int]) -> Dict[int, int]:
+        found: Dict[int, int] = {}
+        # Query in chunks to stay within the limit on query parameters
+        chunk_len: int = 500
+        for i in range(0, len(user_ids), chunk_len):
+            chunk: List[int] = user_ids[i:i + chunk_len]
+            query: tuple = (f"SELECT {KEY_USER_ID}, {KEY_USER_BALANCE} FROM {TABLE_USERS}"
+                            f" WHERE {KEY_USER_ID} IN ({', '.join('?' * len(chunk))})", chunk)
+            found.update(self._db_read(query))
+        return {user_id: found.get(user_id, STARTING_BALANCE) for user_id in user_ids}
+
+    def get_top_balances(self, limit: int) -> List[Tuple[int, int]]:
+        query: tuple = (f"SELECT {KEY_USER_ID}, {KEY_USER_BALANCE} FROM {TABLE_USERS}"
+                        f" WHERE {KEY_USER_BALANCE} IS NOT NULL ORDER BY {KEY_USER_BALANCE} DESC LIMIT ?", [limit])
+        return self._db_read(query)
+
+    def set_balance_for(self, user_id: int, value: int) -> int:
+        query: tuple = (f"REPLACE INTO {TABLE_USERS} ({KEY_USER_ID}, {KEY_USER_BALANCE}) VALUES (?, ?)"
+                        f" RETURNING {KEY_USER_BALANCE}", [user_id, value])
+        user = self._db_write(query)
+        return user[0][0] if user and user[0] else None
+
+    @staticmethod
+    def _add_balance_query(user_id: int, delta: int, is_returning: bool = True) -> tuple:
+        return (f"INSERT INTO {TABLE_USERS} ({KEY_USER_ID}, {KEY_USER_BALANCE}) VALUES (?, ?)"
+                f" ON CONFLICT({KEY_USER_ID}) DO UPDATE SET {KEY_USER_BALANCE}={KEY_USER_BALANCE}+?"
+                + (f" RETURNING {KEY_USER_BALANCE}" if is_returning else ""),
+                [user_id, STARTING_BALANCE + delta, delta])
+
+    @staticmethod
+    def _add_ledger_entries(sqlconn: Connection, entries: List[tuple]) -> None:
+        sqlconn.executemany(
+            f"INSERT INTO {TABLE_LEDGER} ({KEY_LEDGER_USER_ID}, {KEY_LEDGER_GUILD_ID}, {KEY_LEDGER_DELTA},"
+            f" {KEY_LEDGER_SOURCE}, {KEY_LEDGER_TIMESTAMP}) VALUES (?, ?, ?, ?, ?)",
+            entries)
+
+    def add_balance(self, user_id: int, delta: int, source: str, guild_id: Optional[int]) -> int:
+        def _add_balance(sqlconn: Connection) -> list:
+            user: list = sqlconn.execute(*self._add_balance_query(user_id=user_id, delta=delta)).fetchall()
+            self._add_ledger_entries(sqlconn=sqlconn, entries=[
+                _ledger_entry(user_id=user_id, delta=delta, source=source, guild_id=guild_id)])
+            return user
+
+        user = self._db_transaction(_add_balance)
+        return user[0][0] if user and user[0] else None
+
+    def add_balances(self, deltas: List[Tuple[int, int]], ledger: List[tuple], earnings: List[Tuple[int, int]],
+                     submissions: List[tuple]) -> None:
+        queries: List[tuple] = [self._add_balance_query(user_id=user_id, delta=delta, is_returning=False)
+                                for user_id, delta in deltas]
+        queries_earnings: List[tuple] = [self._add_guild_earnings_query(guild_id=guild_id, delta=delta, is_returning=False)
+                                         for guild_id, delta in earnings or []]
+
+        def _add_balances(sqlconn: Connection) -> None:
+            for query_list in [queries, queries_earnings]:
+                if query_list:
+                    sqlconn.executemany(query_list[0][0], [params for _, params in query_list])
+            self._add_ledger_entries(sqlconn=sqlconn, entries=ledger)
+            if submissions:
+                sqlconn.executemany(
+                    f"INSERT OR IGNORE INTO {TABLE_SUBMISSIONS} ({KEY_SUBMISSION_ID}, {KEY_SUBMISSION_USER_ID},"
+                    f" {KEY_SUBMISSION_TIMESTAMP}) VALUES (?, ?, ?)",
+                    submissions)
+
+        if queries or queries_earnings or ledger or submissions:
+            self._db_transaction(_add_balances)
+
+    def transfer(self, from_id: int, to_id: int, amount: int, guild_id: Optional[int]) -> Tuple[int, int, int]:
+        def _transfer(sqlconn: Connection) -> Tuple[int, int, int]:
+            balance_query: str = f"SELECT {KEY_USER_BALANCE} FROM {TABLE_USERS} WHERE {KEY_USER_ID}=?"
+            user_from = sqlconn.execute(balance_query, [from_id]).fetchone()
+            balance_from: int = user_from[0] if user_from else STARTING_BALANCE
+            value: int = max(0, min(balance_from, amount))
+            balance_to: int
+            if value > 0:
+                sqlconn.execute(*self._add_balance_query(user_id=from_id, delta=-value)).fetchall()
+                balance_to = sqlconn.execute(*self._add_balance_query(user_id=to_id, delta=value)).fetchone()[0]
+                self._add_ledger_entries(sqlconn=sqlconn, entries=[
+                    _ledger_entry(user_id=from_id, delta=-value, source=SOURCE_DONATION, guild_id=guild_id),
+                    _ledger_entry(user_id=to_id, delta=value, source=SOURCE_DONATION, guild_id=guild_id)])
+            else:
+                user_to = sqlconn.execute(balance_query, [to_id]).fetchone()
+                balance_to = user_to[0] if user_to else STARTING_BALANCE
+            return value, balance_from, balance_to
+
+        return self._db_transaction(_transfer)
+
+    # Ledger queries
+
+    def get_ledger_for(self, user_id: int, limit: int, before_id: Optional[int]) -> List[tuple]:
+        query: tuple = (f"SELECT {KEY_LEDGER_ID}, {KEY_LEDGER_GUILD_ID}, {KEY_LEDGER_DELTA}, {KEY_LEDGER_SOURCE},"
+                        f" {KEY_LEDGER_TIMESTAMP} FROM {TABLE_LEDGER}"
+                        f" WHERE {KEY_LEDGER_USER_ID}=? AND {KEY_LEDGER_ID}<?"
+                        f" ORDER BY {KEY_LEDGER_ID} DESC LIMIT ?",
+                        [user_id, before_id if before_id is not None else (1 << 63) - 1, limit])
+        return self._db_read(query)
+
+    # Submission queries
+
+    def get_submission_ids(self, limit: int) -> List[int]:
+        query: tuple = (f"SELECT {KEY_SUBMISSION_ID} FROM {TABLE_SUBMISSIONS} ORDER BY {KEY_SUBMISSION_ID} DESC LIMIT ?",
+                        [limit])
+        return [row[0] for row in self._db_read(query)]
+
+    def has_submission(self, message_id: int) -> bool:
+        query: tuple = (f"SELECT 1 FROM {TABLE_SUBMISSIONS} WHERE {KEY_SUBMISSION_ID}=?", [message_id])
+        return any(self._db_read(query))
+
+
+class DictBackend(StorageBackend):
+    """
+    Storage backend holding all values in dictionaries, without SQLite.
+    Nothing is kept once the process ends, so this is only suitable for tests and benchmarks.
+    """
+
+    def __init__(self):
+        self._lock: threading.RLock = threading.RLock()
+        """Lock held for each query, standing in for database transactions."""
+        self._guilds: Dict[int, List[Optional[int]]] = {}
+        """Map of Discord guild IDs to shop message ID and total earnings."""
+        self._users: Dict[int, int] = {}
+        """Map of Discord user IDs to balances."""
+        self._ledger: Dict[int, List[tuple]] = {}
+        """Map of Discord user IDs to their ledger entries as ID, guild ID, delta, source, and timestamp, oldest first."""
+        self._ledger_len: int = 0
+        self._submissions: Dict[int, int] = {}
+        """Map of Discord message IDs for verified submissions to their authors' Discord user IDs."""
+
+    def _guild(self, guild_id: int) -> List[Optional[int]]:
+        return self._guilds.setdefault(guild_id, [None, None])
+
+    def _add_ledger_entries(self, entries: List[tuple]) -> None:
+        for user_id, guild_id, delta, source, timestamp in entries:
+            self._ledger_len += 1
+            self._ledger.setdefault(user_id, []).append((self._ledger_len, guild_id, delta, source, timestamp))
+
+    # Utility methods
+
+    def setup(self) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+    # Guild queries
+
+    def get_guild_earnings(self, guild_id: int) -> int:
+        guild: Optional[List[Optional[int]]] = self._guilds.get(guild_id)
+        return guild[1] if guild and guild[1] else 0
+
+    def set_guild_earnings(self, guild_id: int, value: int) -> int:
+        with self._lock:
+            self._guild(guild_id=guild_id)[1] = value
+            return self.get_guild_earnings(guild_id=guild_id)
+
+    def add_guild_earnings(self, guild_id: int, delta: int) -> int:
+        with self._lock:
+            guild: List[Optional[int]] = self._guild(guild_id=guild_id)
+            guild[1] = (guild[1] or 0) + delta
+            return self.get_guild_earnings(guild_id=guild_id)
+
+    def get_shop_message_id(self, guild_id: int) -> Optional[int]:
+        guild: Optional[List[Optional[int]]] = self._guilds.get(guild_id)
+        return guild[0] if guild else None
+
+    def set_shop_message_id(self, guild_id: int, message_id: int) -> None:
+        with self._lock:
+            self._guild(guild_id=guild_id)[0] = message_id
+
+    # User queries
+
+    def get_balance_for(self, user_id: int) -> int:
+        return self._users.get(user_id, STARTING_BALANCE)
+
+    def get_balances_for(self, user_ids: List[int]) -> Dict[int, int]:
+        return {user_id: self._users.get(user_id, STARTING_BALANCE) for user_id in user_ids}
+
+    def get_top_balances(self, limit: int) -> List[Tuple[int, int]]:
+        with self._lock:
+            return heapq.nlargest(limit, self._users.items(), key=lambda item: item[1])
+
+    def set_balance_for(self, user_id: int, value: int) -> int:
+        with self._lock:
+            self._users[user_id] = value
+            return value
+
+    def add_balance(self, user_id: int, delta: int, source: str, guild_id: Optional[int]) -> int:
+        with self._lock:
+            self._users[user_id] = self._users.get(user_id, STARTING_BALANCE) + delta
+            self._add_ledger_entries(entries=[
+                _ledger_entry(user_id=user_id, delta=delta, source=source, guild_id=guild_id)])
+            return self._users[user_id]
+
+    def add_balances(self, deltas: List[Tuple[int, int]], ledger: List[tuple], earnings: List[Tuple[int, int]],
+                     submissions: List[tuple]) -> None:
+        with self._lock:
+            for user_id, delta in deltas:
+                self._users[user_id] = self._users.get(user_id, STARTING_BALANCE) + delta
+            for guild_id, delta in earnings or []:
+                self.add_guild_earnings(guild_id=guild_id, delta=delta)
+            self._add_ledger_entries(entries=ledger)
+            for message_id, user_id, _ in submissions or []:
+                self._submissions.setdefault(message_id, user_id)
+
+    def transfer(self, from_id: int, to_id: int, amount: int, guild_id: Optional[int]) -> Tuple[int, int, int]:
+        with self._lock:
+            balance_from: int = self._users.get(from_id, STARTING_BALANCE)
+            value: int = max(0, min(balance_from, amount))
+            if value > 0:
+                self._users[from_id] = balance_from - value
+                self._users[to_id] = self._users.get(to_id, STARTING_BALANCE) + value
+                self._add_ledger_entries(entries=[
+                    _ledger_entry(user_id=from_id, delta=-value, source=SOURCE_DONATION, guild_id=guild_id),
+                    _ledger_entry(user_id=to_id, delta=value, source=SOURCE_DONATION, guild_id=guild_id)])
+            return value, balance_from, self._users.get(to_id, STARTING_BALANCE)
+
+    # Ledger queries
+
+    def get_ledger_for(self, user_id: int, limit: int, before_id: Optional[int]) -> List[tuple]:
+        with self._lock:
+            entries: List[tuple] = self._ledger.get(user_id, [])
+            i_end: int = len(entries) if before_id is None \
+                else bisect.bisect_left(entries, before_id, key=lambda entry: entry[0])
+            return entries[max(0, i_end - limit):i_end][::-1]
+
+    # Submission queries
+
+    def get_submission_ids(self, limit: int) -> List[int]:
+        with self._lock:
+            return heapq.nlargest(limit, self._submissions.keys())
+
+    def has_submission(self, message_id: int) -> bool:
+        with self._lock:
+            return message_id in self._submissions
+
+
+def create_backend(name: str) -> StorageBackend:
+    """
+    Creates a storage backend by name.
+    :param name: One of "file" for the database file, "memory" for a shared-cache in-memory SQLite database,
+    or "dict" for dictionaries without SQLite.
+    """
+    if name == "file":
+        return SQLiteBackend(path=PATH_DATABASE)
+    if name == "memory":
+        return SQLiteBackend(path=f"file:{os.path.basename(PATH_DATABASE)}?mode=memory&cache=shared", is_memory=True)
+    if name == "dict":
+        return DictBackend()
+    raise ValueError(f"Unknown database backend '{name}'.")
+
+
+backend: StorageBackend = create_backend(name=DATABASE_BACKEND)
+"""Storage used for all database queries."""
+
+_executor_write: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-write")
+"""Single worker thread queueing all async database writes in order."""
+_executor_read: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=DATABASE_READ_WORKERS, thread_name_prefix="db-read")
+"""Worker threads serving async database reads concurrently with writes."""
+_executor_backup: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-backup")
+"""Worker thread running backups, so that neither reads nor writes queue behind them."""
 
 
 # Utility methods
 
 
+def use_backend(new_backend: StorageBackend) -> None:
+    """
+    Replaces the storage used for all database queries, closing the current backend.
+    Pending changes in the balance cache should be flushed beforehand.
+    """
+    global backend
+    close()
+    backend = new_backend
+    setup()
+
 def setup():
     """
-    Generates database with required tables.
+    Generates database with required tables, and loads values kept in memory.
+    """
+    backend.setup()
+    submissions.load()
+
+def close() -> None:
+    """
+    Closes all database connections once any queued writes have completed.
     """
-    db: Connection = sqlite3.connect(PATH_DATABASE)
-    queries: List[str] = [
-        # Global values
-        f"CREATE TABLE IF NOT EXISTS {TABLE_GUILDS} ({KEY_GUILD_ID} INT PRIMARY KEY, {KEY_GUILD_SHOP_ID} INT, {KEY_GUILD_EARNED} INT)",
-        # User values
-        f"CREATE TABLE IF NOT EXISTS {TABLE_USERS} ({KEY_USER_ID} INT PRIMARY KEY, {KEY_USER_BALANCE} INT)"
-    ]
-    for query in queries:
-        db.execute(query)
-    db.commit()
-    db.close()
+    _executor_write.submit(lambda: None).result()
+    backend.close()
 
-def _db_read(_query: [tuple, str]) -> any:
+def backup() -> Optional[str]:
     """
-    Helper function to perform database reads.
+    Copies the database to a new snapshot file next to the database file while it remains in use,
+    removing the oldest snapshots beyond the configured number to keep.
+
+    Pages are copied in steps with sleeps between each from a snapshot held by a separate read connection,
+    so that neither reads nor writes are blocked while it runs. Changes committed after the backup starts
+    are left for the next backup.
+    Snapshots are written to a temporary file first, so incomplete snapshots are never left in place.
+    :returns: Path to the new snapshot file, or none if the current backend doesn't support backups.
     """
-    sqlconn = sqlite3.connect(PATH_DATABASE)
-    results: any
-    if isinstance(_query, tuple):
-        results = sqlconn.execute(*_query).fetchall()
-    else:
-        results = sqlconn.execute(_query).fetchone()
-    sqlconn.close()
-    return results
+    return backend.backup()
 
-def _db_write(_query: [Tuple[str, list], str]):
+async def backup_async() -> Optional[str]:
     """
-    Helper function to perform database writes.
+    Copies the database to a new snapshot file on its own thread, including all writes queued beforehand.
+    :returns: Path to the new snapshot file, or none if the current backend doesn't support backups.
     """
-    sqlconn = sqlite3.connect(PATH_DATABASE)
-    sqlconn.execute(*_query) if isinstance(_query, tuple) else sqlconn.execute(_query)
-    sqlconn.commit()
-    sqlconn.close()
+    # Wait for queued writes without holding the writer thread for the backup itself
+    await _run_write(lambda: None)
+    return await asyncio.get_running_loop().run_in_executor(_executor_backup, backup)
+
+async def _run_read(func: Callable, **kwargs) -> Any:
+    """
+    Helper function to run a database read on a reader thread without blocking the event loop.
+    """
+    return await asyncio.get_running_loop().run_in_executor(_executor_read, functools.partial(func, **kwargs))
+
+async def _run_write(func: Callable, **kwargs) -> Any:
+    """
+    Helper function to queue a database write on the writer thread without blocking the event loop.
+    """
+    return await asyncio.get_running_loop().run_in_executor(_executor_write, functools.partial(func, **kwargs))
 
 
 # Guild queries
@@ -74,35 +721,33 @@ def get_guild_earnings(guild_id: int) -> int:
     """
     Gets the total earned in the current guild.
     """
-    query: tuple = (f"SELECT {KEY_GUILD_EARNED} FROM {TABLE_GUILDS} WHERE {KEY_GUILD_ID}=?", [guild_id])
-    guild = _db_read(query)
-    return guild[0][0] if guild and guild[0] and guild[0][0] else 0
+    return backend.get_guild_earnings(guild_id=guild_id)
 
 def set_guild_earnings(guild_id: int, value: int) -> int:
     """
     Updates the guild's total earnings value.
     :returns: Global earnings after changes.
     """
-    message_id: int = get_shop_message_id(guild_id=guild_id)
-    query: tuple = (f"REPLACE INTO {TABLE_GUILDS} ({KEY_GUILD_ID}, {KEY_GUILD_SHOP_ID}, {KEY_GUILD_EARNED}) VALUES (?, ?, ?)", [guild_id, message_id, value])
-    _db_write(query)
-    return get_guild_earnings(guild_id=guild_id)
+    return backend.set_guild_earnings(guild_id=guild_id, value=value)
+
+def add_guild_earnings(guild_id: int, delta: int) -> int:
+    """
+    Adds a value to the guild's total earnings in a single statement.
+    :returns: Global earnings after changes.
+    """
+    return backend.add_guild_earnings(guild_id=guild_id, delta=delta)
 
 def get_shop_message_id(guild_id: int) -> Optional[int]:
     """
     Gets the shop message ID for the current guild.
     """
-    query: tuple = (f"SELECT {KEY_GUILD_SHOP_ID} FROM {TABLE_GUILDS} WHERE {KEY_GUILD_ID}=?", [guild_id])
-    found_id = _db_read(query)
-    return found_id[0][0] if found_id and found_id[0] else None
+    return backend.get_shop_message_id(guild_id=guild_id)
 
 def set_shop_message_id(guild_id: int, message_id: int) -> None:
     """
     Updates a guild's shop message ID.
     """
-    earnings: int = get_guild_earnings(guild_id=guild_id)
-    query: tuple = (f"REPLACE INTO {TABLE_GUILDS} ({KEY_GUILD_ID}, {KEY_GUILD_SHOP_ID}, {KEY_GUILD_EARNED}) VALUES (?, ?, ?)", [guild_id, message_id, earnings])
-    _db_write(query)
+    backend.set_shop_message_id(guild_id=guild_id, message_id=message_id)
 
 
 # User queries
@@ -112,18 +757,680 @@ def get_balance_for(user_id: int) -> int:
     """
     Gets the balance database entry for a given user.
     """
-    query: tuple = (f"SELECT {KEY_USER_BALANCE} FROM {TABLE_USERS} WHERE {KEY_USER_ID}=?", [user_id])
-    user = _db_read(query)
+    return backend.get_balance_for(user_id=user_id)
 
-    if not user:
-        return STARTING_BALANCE
-    else:
-        return user[0][0] if user and user[0] else None
+def get_balances_for(user_ids: List[int]) -> Dict[int, int]:
+    """
+    Gets the balance database entries for many users in a single query.
+    :returns: Map of Discord user IDs to balances for all given users.
+    """
+    return backend.get_balances_for(user_ids=user_ids)
+
+def get_top_balances(limit: int) -> List[Tuple[int, int]]:
+    """
+    Gets the users with the highest balances.
+    :param limit: Maximum number of users to return.
+    :returns: List of Discord user IDs and balances, highest balance first.
+    """
+    return backend.get_top_balances(limit=limit)
 
 def set_balance_for(user_id: int, value: int) -> int:
     """
     Updates a user's balance value.
     """
-    query: tuple = (f"REPLACE INTO {TABLE_USERS} ({KEY_USER_ID}, {KEY_USER_BALANCE}) VALUES (?, ?)", [user_id, value])
-    _db_write(query)
-    return get_balance_for(user_id=user_id)
+    return backend.set_balance_for(user_id=user_id, value=value)
+
+def _ledger_entry(user_id: int, delta: int, source: str, guild_id: Optional[int]) -> tuple:
+    """
+    Creates a ledger entry for a change to a user's balance, to be written by the storage backend.
+    """
+    return user_id, guild_id, delta, source, int(time.time())
+
+def add_balance(user_id: int, delta: int, source: str, guild_id: Optional[int] = None) -> int:
+    """
+    Adds a value to a user's balance in a single statement, starting from the default balance for new users.
+    Negative values will be deducted from their balance.
+    The change is recorded in the ledger in the same transaction.
+    :param user_id: Discord user ID for a given user.
+    :param delta: Value to be added to user's balance.
+    :param source: Ledger source for the change, such as SOURCE_AWARD.
+    :param guild_id: Discord guild ID the change was made in, if any.
+    :returns: User's balance after changes.
+    """
+    return backend.add_balance(user_id=user_id, delta=delta, source=source, guild_id=guild_id)
+
+def add_balances(deltas: List[Tuple[int, int]], ledger: List[tuple], earnings: List[Tuple[int, int]] = None,
+                 submissions: List[tuple] = None) -> None:
+    """
+    Adds values to many users' balances in a single transaction, along with their ledger entries.
+    :param deltas: List of Discord user IDs and values to be added to each user's balance.
+    :param ledger: List of ledger entries for all changes, as created by _ledger_entry.
+    :param earnings: List of Discord guild IDs and values to be added to each guild's total earnings.
+    :param submissions: List of Discord message IDs, author user IDs, and timestamps for submissions paid out.
+    """
+    backend.add_balances(deltas=deltas, ledger=ledger, earnings=earnings, submissions=submissions)
+
+def transfer(from_id: int, to_id: int, amount: int, guild_id: Optional[int] = None) -> Tuple[int, int, int]:
+    """
+    Moves an amount from one user's balance to another in a single transaction.
+    The amount moved is limited to the sender's current balance, and is recorded in the ledger as a donation.
+    :param from_id: Discord user ID for the user sending balance.
+    :param to_id: Discord user ID for the user receiving balance.
+    :param amount: Value to be moved between balances.
+    :param guild_id: Discord guild ID the change was made in, if any.
+    :returns: Value moved, sender's balance before changes, and recipient's balance after changes.
+    """
+    return backend.transfer(from_id=from_id, to_id=to_id, amount=amount, guild_id=guild_id)
+
+
+# Ledger queries
+
+
+def get_ledger_for(user_id: int, limit: int, before_id: Optional[int] = None) -> List[tuple]:
+    """
+    Gets a page of ledger entries for a given user, newest first.
+    Pages are found by the ID of the last entry on the previous page, so each page is a single index range scan.
+    :param user_id: Discord user ID for a given user.
+    :param limit: Maximum number of entries to return.
+    :param before_id: Ledger entry ID to return only older entries than, or none to start from the newest.
+    :returns: List of ledger entries as ID, guild ID, delta, source, and timestamp.
+    """
+    return backend.get_ledger_for(user_id=user_id, limit=limit, before_id=before_id)
+
+
+# Submission queries
+
+
+def get_submission_ids(limit: int) -> List[int]:
+    """
+    Gets the message IDs for the most recent verified submissions, newest first.
+    :param limit: Maximum number of message IDs to return.
+    """
+    return backend.get_submission_ids(limit=limit)
+
+def has_submission(message_id: int) -> bool:
+    """
+    Checks whether a submission has been verified.
+    :param message_id: Discord message ID for the submission.
+    """
+    return backend.has_submission(message_id=message_id)
+
+
+# Async queries
+
+
+async def get_guild_earnings_async(guild_id: int) -> int:
+    """
+    Gets the total earned in the current guild.
+    """
+    return await _run_read(get_guild_earnings, guild_id=guild_id)
+
+async def set_guild_earnings_async(guild_id: int, value: int) -> int:
+    """
+    Updates the guild's total earnings value.
+    :returns: Global earnings after changes.
+    """
+    return await _run_write(set_guild_earnings, guild_id=guild_id, value=value)
+
+async def add_guild_earnings_async(guild_id: int, delta: int) -> int:
+    """
+    Adds a value to the guild's total earnings in a single statement.
+    :returns: Global earnings after changes.
+    """
+    return await _run_write(add_guild_earnings, guild_id=guild_id, delta=delta)
+
+async def get_shop_message_id_async(guild_id: int) -> Optional[int]:
+    """
+    Gets the shop message ID for the current guild.
+    """
+    return await _run_read(get_shop_message_id, guild_id=guild_id)
+
+async def set_shop_message_id_async(guild_id: int, message_id: int) -> None:
+    """
+    Updates a guild's shop message ID.
+    """
+    return await _run_write(set_shop_message_id, guild_id=guild_id, message_id=message_id)
+
+async def get_balance_for_async(user_id: int) -> int:
+    """
+    Gets the balance database entry for a given user.
+    """
+    return await _run_read(get_balance_for, user_id=user_id)
+
+async def get_top_balances_async(limit: int) -> List[Tuple[int, int]]:
+    """
+    Gets the users with the highest balances.
+    :returns: List of Discord user IDs and balances, highest balance first.
+    """
+    return await _run_read(get_top_balances, limit=limit)
+
+async def set_balance_for_async(user_id: int, value: int) -> int:
+    """
+    Updates a user's balance value.
+    """
+    return await _run_write(set_balance_for, user_id=user_id, value=value)
+
+async def add_balance_async(user_id: int, delta: int, source: str, guild_id: Optional[int] = None) -> int:
+    """
+    Adds a value to a user's balance in a single statement, recording the change in the ledger.
+    :returns: User's balance after changes.
+    """
+    return await _run_write(add_balance, user_id=user_id, delta=delta, source=source, guild_id=guild_id)
+
+async def transfer_async(from_id: int, to_id: int, amount: int, guild_id: Optional[int] = None) -> Tuple[int, int, int]:
+    """
+    Moves an amount from one user's balance to another in a single transaction.
+    :returns: Value moved, sender's balance before changes, and recipient's balance after changes.
+    """
+    return await _run_write(transfer, from_id=from_id, to_id=to_id, amount=amount, guild_id=guild_id)
+
+async def get_balances_for_async(user_ids: List[int]) -> Dict[int, int]:
+    """
+    Gets the balance database entries for many users in a single query.
+    :returns: Map of Discord user IDs to balances for all given users.
+    """
+    return await _run_read(get_balances_for, user_ids=user_ids)
+
+async def add_balances_async(deltas: List[Tuple[int, int]], ledger: List[tuple], earnings: List[Tuple[int, int]] = None,
+                             submissions: List[tuple] = None) -> None:
+    """
+    Adds values to many users' balances in a single transaction, along with their ledger entries.
+    """
+    return await _run_write(add_balances, deltas=deltas, ledger=ledger, earnings=earnings, submissions=submissions)
+
+async def get_ledger_for_async(user_id: int, limit: int, before_id: Optional[int] = None) -> List[tuple]:
+    """
+    Gets a page of ledger entries for a given user, newest first.
+    :returns: List of ledger entries as ID, guild ID, delta, source, and timestamp.
+    """
+    return await _run_read(get_ledger_for, user_id=user_id, limit=limit, before_id=before_id)
+
+
+async def has_submission_async(message_id: int) -> bool:
+    """
+    Checks whether a submission has been verified.
+    """
+    return await _run_read(has_submission, message_id=message_id)
+
+
+# Submission cache
+
+
+class SubmissionSet:
+    """
+    Message IDs for recently verified submissions, kept in memory in front of the database.
+
+    Staff reactions in the submission channels are checked against this set first, and only submissions
+    missing from it are checked against the database, so the set stays bounded over the whole event.
+    Submissions are recorded in the database in the same transaction as their payout by the balance cache,
+    so each is only paid out once across restarts and reloads.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size: int = max_size
+        """Maximum number of message IDs kept in memory."""
+        self._ids: OrderedDict[int, None] = OrderedDict()
+        """Discord message IDs for verified submissions, least-recently used first."""
+
+    def __contains__(self, message_id: int) -> bool:
+        return message_id in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _add(self, message_id: int) -> None:
+        self._ids[message_id] = None
+        self._ids.move_to_end(message_id)
+        while len(self._ids) > self.max_size:
+            self._ids.popitem(last=False)
+
+    def load(self) -> None:
+        """
+        Replaces all message IDs with the most recent recorded in the database.
+        """
+        self._ids = OrderedDict.fromkeys(reversed(get_submission_ids(limit=self.max_size)))
+
+    async def is_verified(self, message_id: int) -> bool:
+        """
+        Checks whether a submission has been verified, reading from the database if it's not kept in memory.
+        """
+        if message_id in self._ids:
+            return True
+        if await has_submission_async(message_id=message_id):
+            self._add(message_id=message_id)
+            return True
+        return False
+
+    async def claim(self, message_id: int) -> bool:
+        """
+        Marks a submission as verified in memory, unless it was already verified.
+        The check and change in memory are made before any await, so concurrent reactions can't both claim a submission.
+        The submission must then be recorded in the database with its payout, using BalanceCache.add.
+        :param message_id: Discord message ID for the submission.
+        :returns: Whether the submission was claimed, or false if it was already verified.
+        """
+        if message_id in self._ids:
+            return False
+        self._add(message_id=message_id)
+        try:
+            # Check submissions verified in earlier sessions that are no longer kept in memory
+            return not await has_submission_async(message_id=message_id)
+        except BaseException:
+            self._ids.pop(message_id, None)
+            raise
+
+
+submissions: SubmissionSet = SubmissionSet(max_size=SUBMISSION_CACHE_SIZE)
+"""Message IDs for recently verified submissions."""
+
+
+# Balance cache
+
+
+class Leaderboard:
+    """
+    Incrementally maintained set of the users with the highest balances.
+
+    Holds the exact top users by balance, keeping between the leaderboard size and twice as many users,
+    so that changes to balances are applied in memory as they happen.
+    The database is only read again once enough users have dropped off the bottom that users with
+    higher balances may be missing.
+    """
+
+    def __init__(self, size: int):
+        self.size: int = size
+        """Number of users shown on the leaderboard."""
+        self._balances: Dict[int, int] = {}
+        self._floor: Optional[int] = None
+        """Highest possible balance of any user not held, or none if all users are held."""
+        self._is_loaded: bool = False
+        self._pending: Optional[Dict[int, int]] = None
+        """Balances changed while loading from the database, to be applied once loaded."""
+
+    def is_stale(self) -> bool:
+        """
+        Whether the leaderboard must be loaded from the database before it can be shown.
+        """
+        return not self._is_loaded or (self._floor is not None and len(self._balances) < self.size)
+
+    def update(self, user_id: int, balance: int) -> None:
+        """
+        Applies a change to a user's balance.
+        """
+        if self._pending is not None:
+            self._pending[user_id] = balance
+        if not self._is_loaded:
+            return
+        if user_id in self._balances or self._floor is None or balance > self._floor:
+            self._balances[user_id] = balance
+        if self._floor is not None and user_id in self._balances and balance < self._floor:
+            # Users dropping below any users not held can no longer be placed
+            del self._balances[user_id]
+        if len(self._balances) > self.size * 2:
+            # Drop the lowest user, who becomes the highest possible balance of users not held
+            user_id_lowest: int = min(self._balances, key=self._balances.get)
+            balance_lowest: int = self._balances.pop(user_id_lowest)
+            self._floor = balance_lowest if self._floor is None else max(self._floor, balance_lowest)
+
+    async def load(self, balances: Dict[int, int]) -> None:
+        """
+        Loads the users with the highest balances from the database.
+        :param balances: Current balances for users with changes not yet written to the database.
+        """
+        self._pending = {}
+        try:
+            rows: List[Tuple[int, int]] = await get_top_balances_async(limit=self.size * 2)
+        finally:
+            pending: Dict[int, int] = self._pending
+            self._pending = None
+        self._balances = dict(rows)
+        self._floor = rows[-1][1] if len(rows) >= self.size * 2 else None
+        self._is_loaded = True
+        for user_id, balance in {**balances, **pending}.items():
+            self.update(user_id=user_id, balance=balance)
+
+    def top(self) -> List[Tuple[int, int]]:
+        """
+        Gets the users with the highest balances.
+        :returns: List of Discord user IDs and balances, highest balance first.
+        """
+        return heapq.nlargest(self.size, self._balances.items(), key=lambda item: item[1])
+
+
+class EarningsAccumulator:
+    """
+    Per-guild total earnings added in memory since they were last written to the database.
+
+    Earnings are added to for nearly every change to a balance, so rather than rewriting the guild's row
+    each time, changes are summed here and written in the same transaction as the balance cache flush.
+    """
+
+    def __init__(self):
+        self._pending: Dict[int, int] = {}
+
+    def add(self, guild_id: int, delta: int) -> None:
+        """
+        Adds a value to the guild's total earnings.
+        """
+        self._pending[guild_id] = self._pending.get(guild_id, 0) + delta
+
+    async def get(self, guild_id: int) -> int:
+        """
+        Gets the total earned in the current guild, including earnings not yet written to the database.
+        """
+        earnings: int = await get_guild_earnings_async(guild_id=guild_id)
+        return earnings + self._pending.get(guild_id, 0)
+
+    def take(self) -> List[Tuple[int, int]]:
+        """
+        Removes all pending earnings to be written to the database.
+        :returns: List of Discord guild IDs and values to be added to each guild's total earnings.
+        """
+        pending: List[Tuple[int, int]] = [(guild_id, delta) for guild_id, delta in self._pending.items() if delta]
+        self._pending = {}
+        return pending
+
+    def restore(self, pending: List[Tuple[int, int]]) -> None:
+        """
+        Returns earnings removed by take that could not be written, to be written on the next flush.
+        """
+        for guild_id, delta in pending:
+            self.add(guild_id=guild_id, delta=delta)
+
+
+class BalanceCache:
+    """
+    Write-behind cache of user balances in front of the database.
+
+    Balances are read from the database once and kept in memory, with changes applied in memory and
+    marked as pending until the next flush writes them all in a single transaction.
+    Pending changes are written as deltas, so flushing never overwrites changes made elsewhere,
+    and are written in the same transaction as their ledger entries.
+    Up to a maximum number of users are kept, with the least-recently used users evicted once
+    they have no pending changes and no changes still being written.
+    All changes are also applied to the leaderboard, and pending guild earnings are written in the
+    same transaction as pending balances.
+    """
+
+    class _Entry:
+        __slots__ = ("balance", "delta", "writing")
+
+        def __init__(self, balance: int):
+            self.balance: int = balance
+            """User's current balance, including any pending changes."""
+            self.delta: int = 0
+            """Value added to user's balance since the last flush."""
+            self.writing: int = 0
+            """Value being written to the database by a flush that hasn't yet committed."""
+
+        def is_dirty(self) -> bool:
+            """
+            Whether the user's balance in memory differs from their balance in the database.
+            """
+            return bool(self.delta or self.writing)
+
+    def __init__(self, max_size: int, leaderboard_size: int, earnings: EarningsAccumulator):
+        self.max_size: int = max_size
+        """Number of users kept in memory before evicting users with no pending changes."""
+        self.earnings: EarningsAccumulator = earnings
+        """Guild earnings written with each flush."""
+        self.leaderboard: Leaderboard = Leaderboard(size=leaderboard_size)
+        """Users with the highest balances."""
+        self._entries: OrderedDict[int, BalanceCache._Entry] = OrderedDict()
+        self._clean: OrderedDict[int, None] = OrderedDict()
+        """Discord user IDs for users that can be evicted, least-recently used first."""
+        self._ledger: List[tuple] = []
+        self._submissions: List[tuple] = []
+        """Submissions paid out since the last flush, as Discord message ID, author user ID, and timestamp."""
+        self._leaderboard_lock: asyncio.Lock = asyncio.Lock()
+        self._write_task: Optional[asyncio.Task] = None
+        """Task writing the most recent flush, which runs to completion even if the flush is cancelled."""
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def _get_entry(self, user_id: int) -> _Entry:
+        entry: Optional[BalanceCache._Entry] = self._entries.get(user_id)
+        if entry is None:
+            balance: int = await get_balance_for_async(user_id=user_id)
+            # Use any entry added for this user while reading from the database
+            entry = self._entries.get(user_id)
+            if entry is None:
+                entry = BalanceCache._Entry(balance=balance)
+                self._entries[user_id] = entry
+        self._touch(user_id=user_id, entry=entry)
+        return entry
+
+    async def _get_entries(self, user_ids: List[int]) -> List[_Entry]:
+        missing: List[int] = [user_id for user_id in user_ids if user_id not in self._entries]
+        while any(missing):
+            found: Dict[int, int] = await get_balances_for_async(user_ids=missing)
+            for user_id, balance in found.items():
+                # Use any entry added for this user while reading from the database
+                if user_id not in self._entries:
+                    self._entries[user_id] = BalanceCache._Entry(balance=balance)
+            # Load again any users evicted while reading from the database
+            missing = [user_id for user_id in user_ids if user_id not in self._entries]
+        for user_id in user_ids:
+            self._touch(user_id=user_id, entry=self._entries[user_id])
+        return [self._entries[user_id] for user_id in user_ids]
+
+    def _touch(self, user_id: int, entry: _Entry) -> None:
+        """
+        Marks a user as most-recently used, and tracks whether they can be evicted after any changes.
+        """
+        self._entries.move_to_end(user_id)
+        if entry.is_dirty():
+            self._clean.pop(user_id, None)
+        else:
+            self._clean[user_id] = None
+            self._clean.move_to_end(user_id)
+
+    def _evict(self) -> None:
+        """
+        Removes least-recently used users with no pending or uncommitted changes until the cache is within its maximum size.
+        Users with changes still being written are kept, as reading them again would give their balance before the write.
+        Only users that can be evicted are visited, so a cache full of pending changes is never scanned.
+        """
+        if len(self._entries) <= self.max_size:
+            return
+        # Never evict the most-recently used user, who may still be in use by the caller
+        user_id_last: int = next(reversed(self._entries))
+        while len(self._entries) > self.max_size and self._clean:
+            user_id: int = next(iter(self._clean))
+            if user_id == user_id_last:
+                if len(self._clean) == 1:
+                    break
+                self._clean.move_to_end(user_id)
+                continue
+            del self._clean[user_id]
+            del self._entries[user_id]
+
+    async def get(self, user_id: int) -> int:
+        """
+        Gets the balance for a given user.
+        """
+        entry: BalanceCache._Entry = await self._get_entry(user_id=user_id)
+        self._evict()
+        return entry.balance
+
+    async def add(self, user_id: int, delta: int, source: str, guild_id: Optional[int] = None,
+                  submission_id: Optional[int] = None) -> int:
+        """
+        Adds a value to a user's balance. Negative values will be deducted from their balance.
+        :param user_id: Discord user ID for a given user.
+        :param delta: Value to be added to user's balance.
+        :param source: Ledger source for the change, such as SOURCE_AWARD.
+        :param guild_id: Discord guild ID the change was made in, if any.
+        :param submission_id: Discord message ID for a submission paid out by the change, to be recorded as verified
+        in the same transaction as the change.
+        :returns: User's balance after changes.
+        """
+        entry: BalanceCache._Entry = await self._get_entry(user_id=user_id)
+        entry.balance += delta
+        entry.delta += delta
+        if submission_id is not None:
+            self._submissions.append((submission_id, user_id, int(time.time())))
+        if delta:
+            self._ledger.append(_ledger_entry(user_id=user_id, delta=delta, source=source, guild_id=guild_id))
+            self.leaderboard.update(user_id=user_id, balance=entry.balance)
+        self._touch(user_id=user_id, entry=entry)
+        self._evict()
+        return entry.balance
+
+    async def add_many(self, user_ids: List[int], delta: int, source: str, guild_id: int) -> Dict[int, int]:
+        """
+        Adds the same value to many users' balances, and writes all changes immediately in a single transaction
+        along with any positive change to the guild's total earnings and all other pending changes.
+        :param user_ids: List of Discord user IDs for all users to change.
+        :param delta: Value to be added to each user's balance.
+        :param source: Ledger source for the changes, such as SOURCE_AWARD.
+        :param guild_id: Discord guild ID the changes were made in.
+        :returns: Map of Discord user IDs to balances after changes.
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        entries: List[BalanceCache._Entry] = await self._get_entries(user_ids=user_ids)
+        for user_id, entry in zip(user_ids, entries):
+            entry.balance += delta
+            entry.delta += delta
+            if delta:
+                self._ledger.append(_ledger_entry(user_id=user_id, delta=delta, source=source, guild_id=guild_id))
+                self.leaderboard.update(user_id=user_id, balance=entry.balance)
+            self._touch(user_id=user_id, entry=entry)
+        balances_after: Dict[int, int] = {user_id: entry.balance for user_id, entry in zip(user_ids, entries)}
+        if delta > 0:
+            self.earnings.add(guild_id=guild_id, delta=delta * len(user_ids))
+        await self.flush()
+        return balances_after
+
+    async def transfer(self, from_id: int, to_id: int, amount: int, guild_id: Optional[int] = None) -> Tuple[int, int, int]:
+        """
+        Moves an amount from one user's balance to another as a donation, limited to the sender's current balance.
+        :returns: Value moved, sender's balance before changes, and recipient's balance after changes.
+        """
+        await self._get_entry(user_id=from_id)
+        entry_to: BalanceCache._Entry = await self._get_entry(user_id=to_id)
+        # Re-fetch sender in case they were evicted while loading recipient
+        entry_from: BalanceCache._Entry = await self._get_entry(user_id=from_id)
+        balance_from: int = entry_from.balance
+        value: int = max(0, min(balance_from, amount))
+        entry_from.balance -= value
+        entry_from.delta -= value
+        entry_to.balance += value
+        entry_to.delta += value
+        if value:
+            self._ledger.extend([
+                _ledger_entry(user_id=from_id, delta=-value, source=SOURCE_DONATION, guild_id=guild_id),
+                _ledger_entry(user_id=to_id, delta=value, source=SOURCE_DONATION, guild_id=guild_id)])
+            self.leaderboard.update(user_id=from_id, balance=entry_from.balance)
+            self.leaderboard.update(user_id=to_id, balance=entry_to.balance)
+        self._touch(user_id=from_id, entry=entry_from)
+        self._touch(user_id=to_id, entry=entry_to)
+        self._evict()
+        return value, balance_from, entry_to.balance
+
+    async def get_ledger_for(self, user_id: int, limit: int, before_id: Optional[int] = None) -> List[tuple]:
+        """
+        Gets a page of ledger entries for a given user, newest first, with entries not yet written on the first page.
+        :param user_id: Discord user ID for a given user.
+        :param limit: Maximum number of entries to read from the database.
+        :param before_id: Ledger entry ID to return only older entries than, or none to start from the newest.
+        :returns: List of ledger entries as ID, guild ID, delta, source, and timestamp.
+        Entries not yet written have no ID, as none is assigned until they're written.
+        """
+        entries: List[tuple]
+        while True:
+            # Wait for any write in progress, as its entries may or may not be read from the database
+            while self._write_task and not self._write_task.done():
+                await asyncio.wait([self._write_task])
+            write_task: Optional[asyncio.Task] = self._write_task
+            entries = await get_ledger_for_async(user_id=user_id, limit=limit, before_id=before_id)
+            # Read again if a flush started writing while reading
+            if self._write_task is write_task:
+                break
+        if before_id is None:
+            entries = [(None, guild_id, delta, source, timestamp)
+                       for entry_user_id, guild_id, delta, source, timestamp in reversed(self._ledger)
+                       if entry_user_id == user_id] + entries
+        return entries
+
+    async def top(self) -> List[Tuple[int, int]]:
+        """
+        Gets the users with the highest balances, reading from the database only if the leaderboard is stale.
+        :returns: List of Discord user IDs and balances, highest balance first.
+        """
+        async with self._leaderboard_lock:
+            if self.leaderboard.is_stale():
+                # Users with pending changes are never evicted, so this includes all balances not yet written
+                await self.leaderboard.load(balances={
+                    user_id: entry.balance
+                    for user_id, entry in self._entries.items()
+                    if entry.is_dirty()})
+        return self.leaderboard.top()
+
+    async def flush(self) -> int:
+        """
+        Writes all pending changes and guild earnings to the database in a single transaction.
+
+        Cancelling a flush doesn't cancel its write, which is finished by the database thread regardless,
+        and the next flush waits for it to finish first, so changes are never written twice.
+        :returns: Number of users with changes written.
+        """
+        # Wait for any write left running by a cancelled flush, restoring its changes if it fails
+        while self._write_task and not self._write_task.done():
+            await asyncio.wait([self._write_task])
+
+        pending: List[Tuple[int, BalanceCache._Entry, int]] = [
+            (user_id, entry, entry.delta)
+            for user_id, entry in self._entries.items()
+            if entry.delta]
+        ledger: List[tuple] = self._ledger
+        submissions: List[tuple] = self._submissions
+        earnings: List[Tuple[int, int]] = self.earnings.take()
+        if not pending and not ledger and not earnings and not submissions:
+            return 0
+        for _, entry, delta in pending:
+            entry.delta -= delta
+            entry.writing += delta
+        self._ledger = []
+        self._submissions = []
+        self._write_task = asyncio.create_task(self._write(
+            pending=pending,
+            ledger=ledger,
+            earnings=earnings,
+            submissions=submissions))
+        return await asyncio.shield(self._write_task)
+
+    async def _write(self, pending: List[Tuple[int, _Entry, int]], ledger: List[tuple], earnings: List[Tuple[int, int]],
+                     submissions: List[tuple]) -> int:
+        """
+        Writes changes taken by a flush, keeping their users from being evicted until the write has committed.
+        """
+        try:
+            await add_balances_async(
+                deltas=[(user_id, delta) for user_id, _, delta in pending],
+                ledger=ledger,
+                earnings=earnings,
+                submissions=submissions)
+        except Exception:
+            # Restore pending changes to be written on the next flush
+            for _, entry, delta in pending:
+                entry.writing -= delta
+                entry.delta += delta
+            self._ledger = ledger + self._ledger
+            self._submissions = submissions + self._submissions
+            self.earnings.restore(pending=earnings)
+            raise
+        for user_id, entry, delta in pending:
+            entry.writing -= delta
+            # Users are kept while their changes are written, so are still in the cache
+            if not entry.is_dirty():
+                self._clean[user_id] = None
+        self._evict()
+        return len(pending)
+
+
+earnings: EarningsAccumulator = EarningsAccumulator()
+"""Total earnings for all guilds added since the last flush of the balance cache."""
+balances: BalanceCache = BalanceCache(max_size=BALANCE_CACHE_SIZE, leaderboard_size=LEADERBOARD_SIZE, earnings=earnings)
+"""Balances for all users, read and changed in memory and flushed to the database periodically."""
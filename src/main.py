@@ -6,12 +6,11 @@
 import asyncio
 import logging
 from logging.handlers import RotatingFileHandler
-from typing import Optional, Any, List
+from typing import Optional, Sequence
 
-from discord import AllowedMentions, Guild
-from discord.ext import commands
+from discord import AllowedMentions, Guild, Member, Role, Emoji
+from discord.ext import commands, tasks
 from discord.ext.commands import Context, HelpCommand
-from importlib import reload
 
 import config
 import db
@@ -30,6 +29,7 @@ Contents:
                 SHelpCommand
             Init
             Bot events
+            Bot tasks
             Bot utilities
     Init
     Global commands
@@ -80,14 +80,7 @@ class SBot(commands.Bot):
             await self._send_help()
 
         async def _send_help(self) -> None:
-            command_list: List[Any] = [command for command in self.context.bot.commands
-                                       if await command.can_run(self.context)
-                                       and not command.hidden
-                                       and not command.name == "help"]
-            embed = utils.get_help_message(
-                guild=self.context.guild,
-                bot=self.context.bot,
-                commands=command_list)
+            embed = await utils.get_help_message_for(ctx=self.context)
             if embed:
                 await self.get_destination().send(embed=embed)
 
@@ -97,6 +90,10 @@ class SBot(commands.Bot):
         super().__init__(
             command_prefix=COMMAND_PREFIX,
             intents=DISCORD_INTENTS,
+            # Reactions are handled from raw events using the commands cog's own message cache
+            max_messages=None,
+            # Members are only needed in bulk when awarding roles, so are fetched on demand rather than kept for all guilds
+            chunk_guilds_at_startup=False,
             description=strings.get("client_description"),
             allowed_mentions=AllowedMentions.none())
         self.help_command = self.SHelpCommand()
@@ -104,6 +101,9 @@ class SBot(commands.Bot):
         self.db = db
         """Bot database instance."""
 
+        self.strings_modified_time: float = strings.modified_time()
+        """Time the strings data file in use was last modified."""
+
     # Bot events
 
     async def setup_hook(self):
@@ -112,20 +112,61 @@ class SBot(commands.Bot):
         """
         # Load database
         db.setup()
+        self.flush_database.start()
+        self.backup_database.start()
+        self.watch_strings.start()
         # Load all extensions on setup
         for ext in EXTENSIONS:
             await self.load_extension(name=ext)
 
     async def on_ready(self):
         """
-        Inherited from Client. Called once internally after all setup. Used only to log notice.
+        Inherited from Client. Called once internally after all setup. Used to index emojis and log notice.
         """
+        utils.index_emojis(bot=self)
         msg = strings.get("client_login").format(
             self.user.name,
             self.user.discriminator,
             self.user.id)
         print(msg)
 
+    async def on_member_update(self, before: Member, after: Member):
+        """
+        Inherited from Client. Called when a member's profile changes. Used to drop cached roles when their roles change.
+        """
+        if before.roles != after.roles:
+            utils.clear_roles(guild_id=after.guild.id, user_id=after.id)
+
+    async def on_member_remove(self, member: Member):
+        """
+        Inherited from Client. Called when a member leaves a guild. Used to drop their cached roles.
+        """
+        utils.clear_roles(guild_id=member.guild.id, user_id=member.id)
+
+    async def on_guild_role_delete(self, role: Role):
+        """
+        Inherited from Client. Called when a role is deleted. Used to drop all cached roles in the guild, as any member may have had it.
+        """
+        utils.clear_roles(guild_id=role.guild.id)
+
+    async def on_guild_emojis_update(self, guild: Guild, before: Sequence[Emoji], after: Sequence[Emoji]):
+        """
+        Inherited from Client. Called when a guild's emojis change. Used to rebuild the emoji index.
+        """
+        utils.index_emojis(bot=self)
+        utils.clear_help()
+
+    async def close(self) -> None:
+        """
+        Inherited from Client. Called on shutdown. Used to write pending changes and release the database after disconnecting.
+        """
+        self.flush_database.cancel()
+        self.backup_database.cancel()
+        self.watch_strings.cancel()
+        await super().close()
+        await db.balances.flush()
+        db.close()
+
     async def on_command_error(self, ctx: Context, error: Exception) -> None:
         """
         Additional behaviours on errors using commands to either suppress, react, or reply.
@@ -162,6 +203,47 @@ class SBot(commands.Bot):
             if reaction:
                 await ctx.message.add_reaction(reaction)
 
+    # Bot tasks
+
+    @tasks.loop(seconds=config.BALANCE_FLUSH_SECONDS)
+    async def flush_database(self) -> None:
+        """
+        Writes pending changes held in memory to the database.
+        """
+        # Log errors rather than stopping the loop, as pending changes are kept to be written on the next interval
+        try:
+            await db.balances.flush()
+        except Exception as error:
+            err.log(error)
+
+    @tasks.loop(hours=config.BACKUP_INTERVAL_HOURS)
+    async def backup_database(self) -> None:
+        """
+        Writes pending changes to the database, then saves a snapshot of the database without pausing other queries.
+        """
+        # Skip the first run on startup, so that restarting repeatedly doesn't rotate out older snapshots
+        if self.backup_database.current_loop == 0:
+            return
+        # Log errors rather than stopping the loop, so that later backups are still made
+        try:
+            await db.balances.flush()
+            path: Optional[str] = await db.backup_async()
+            if path:
+                logging.getLogger("discord").log(level=logging.INFO, msg=strings.get("log_backup").format(path))
+        except Exception as error:
+            err.log(error)
+
+    @tasks.loop(seconds=config.STRINGS_WATCH_SECONDS)
+    async def watch_strings(self) -> None:
+        """
+        Reloads the strings data file when it's changed.
+        """
+        if strings.modified_time() != self.strings_modified_time:
+            try:
+                await self.reload_strings()
+            except (OSError, ValueError) as error:
+                logging.getLogger("discord").log(level=logging.WARNING, msg=strings.get("log_strings_invalid").format(error))
+
     # Bot utilities
 
     async def sync_guild(self, guild: Guild):
@@ -172,12 +254,19 @@ class SBot(commands.Bot):
         self.tree.copy_global_to(guild=guild)
         await self.tree.sync(guild=guild)
 
-    def reload_strings(self) -> None:
+    async def reload_strings(self) -> None:
         """
         Reloads all text strings from data file for bot commands and interactions.
+        The file is read and checked on a worker thread, and the strings in use are only replaced if it's valid.
+        Command names are read from strings when commands are loaded, so only change after reloading commands.
+        :raises ValueError: If the file isn't valid JSON, or if any strings are invalid.
         """
-        reload(strings)
-        reload(utils)
+        # Mark this version as seen before reading, so invalid files are only reported once
+        self.strings_modified_time = strings.modified_time()
+        data: dict = await asyncio.get_running_loop().run_in_executor(None, strings.load)
+        strings.swap(data=data)
+        utils.clear_help()
+        logging.getLogger("discord").log(level=logging.INFO, msg=strings.get("log_strings_reloaded").format(config.PATH_STRINGS))
 
 
 # Init
@@ -4,13 +4,182 @@
 # https://github.com/StardewValleyDiscord/SDVAutumn2022
 
 import json
+import os
 import random as rand
-from typing import Optional, Any
+from fnmatch import fnmatchcase
+from string import Formatter
+from typing import Optional, Any, Dict, List
 
 from config import PATH_STRINGS
 
-with open(file=PATH_STRINGS, mode="r", encoding="utf8") as strings_file:
-    _data = json.load(strings_file)
+
+FORMAT_ARGS: Dict[str, int] = {
+    # Commands
+    "commands_response_backup": 1,
+    "commands_response_earnings_get": 1,
+    "commands_response_earnings_set": 2,
+    "commands_response_enable*": 1,
+    "commands_response_send_success": 2,
+    "commands_response_edit_success": 2,
+    "commands_response_params_format": 2,
+    "commands_response_reaction_stats": 1,
+    "commands_response_reaction_stats_format": 2,
+    "commands_response_strings_invalid": 1,
+    "commands_response_test_string": 2,
+    "commands_response_test_emoji": 1,
+    "commands_response_test_emoji_format": 3,
+    "commands_response_test_roles": 1,
+    "commands_response_test_roles_format": 4,
+    "commands_response_test_fish": 1,
+    "commands_response_test_fish_format": 2,
+    "error_string_not_found": 1,
+    "error_params_not_expected": 2,
+    "help_content": 1,
+    "help_command_format": 2,
+    "help_command_admin_format": 2,
+    # Logging
+    "client_login": 3,
+    "info_connection_timed_out": 1,
+    "log_admin_*": 4,
+    "log_backup": 1,
+    "log_strings_reloaded": 1,
+    "log_strings_invalid": 1,
+    # Balance
+    "balance_responses_added": 1,
+    "balance_responses_removed": 1,
+    "balance_responses_other": 2,
+    "balance_responses_none": 2,
+    "balance_responses_one": 2,
+    "balance_responses_many": 2,
+    "balance_responses_too_low": 4,
+    "balance_responses_donated": 4,
+    "award_responses": 2,
+    "award_many_responses": 2,
+    "award_many_response_failed": 1,
+    "history_response_format": 2,
+    "history_response_none": 1,
+    "history_response_more": 4,
+    "history_entry_format": 4,
+    "leaderboard_response_format": 1,
+    "leaderboard_entry_format": 3,
+    # Shop
+    "shop_role_format": 2,
+    "shop_responses_poor": 1,
+    "shop_responses_purchase": 2,
+    "message_shop_title": 1,
+    "message_shop_body": 2,
+    "message_shop_role": 3,
+    # Games
+    "submission_responses_*": 1,
+    "fishing_response_format": 3,
+    "strength_response_format": 5,
+    "wheel_response_format": 2,
+}
+"""
+Number of positional arguments given when formatting each string, with keys matching many strings by wildcard.
+Strings not listed here aren't formatted, and aren't checked for placeholders.
+"""
+
+
+def _parse_fields(template: str) -> List[str]:
+    """
+    Gets all placeholders in a string, including those nested in format specs, in the order they're formatted.
+    :raises ValueError: If any placeholders are malformed.
+    """
+    fields: List[str] = []
+    for _, field, format_spec, _ in Formatter().parse(template):
+        if field is not None:
+            fields.append(field)
+            if format_spec:
+                fields.extend(_parse_fields(template=format_spec))
+    return fields
+
+def _check_template(template: str, arg_count: Optional[int]) -> List[str]:
+    """
+    Checks a string for malformed placeholders, and for placeholders beyond the arguments given when formatting.
+    :param template: String to check.
+    :param arg_count: Number of positional arguments given when formatting, or none if not formatted.
+    :return: List of errors found, if any.
+    """
+    try:
+        fields: List[str] = _parse_fields(template=template)
+    except ValueError as error:
+        return [str(error)]
+    if arg_count is None:
+        return []
+    errors: List[str] = []
+    auto_index: int = 0
+    is_numbered: bool = False
+    for field in fields:
+        name: str = field.split(".", 1)[0].split("[", 1)[0]
+        if not name:
+            name = str(auto_index)
+            auto_index += 1
+        elif name.isdigit():
+            is_numbered = True
+        if auto_index and is_numbered:
+            errors.append("placeholders mix automatic '{}' and numbered '{0}' fields")
+            break
+        if not name.isdigit():
+            errors.append(f"named placeholder '{{{field}}}' is never given")
+        elif int(name) >= arg_count:
+            errors.append(f"placeholder '{{{field}}}' is beyond the {arg_count} argument(s) given")
+    return errors
+
+def compile_data(data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compiles parsed strings data, checking all strings and converting lists of strings to tuples for random choices.
+    :param data: Strings data parsed from the strings data file.
+    :return: Compiled strings data.
+    :raises ValueError: If any strings are malformed or expect more arguments than are given.
+    """
+    compiled: Dict[str, Any] = {}
+    errors: List[str] = []
+    for key, value in data.items():
+        pattern: Optional[str] = key if key in FORMAT_ARGS \
+            else next((pattern for pattern in FORMAT_ARGS if fnmatchcase(key, pattern)), None)
+        arg_count: Optional[int] = FORMAT_ARGS.get(pattern) if pattern else None
+        if isinstance(value, list):
+            value = tuple(value)
+            if not value:
+                errors.append(f"{key}: list is empty")
+        templates: tuple = value if isinstance(value, tuple) else (value,)
+        errors.extend(f"{key}: {error}"
+                      for template in templates if isinstance(template, str)
+                      for error in _check_template(template=template, arg_count=arg_count))
+        compiled[key] = value
+    if errors:
+        raise ValueError("Invalid strings:\n" + "\n".join(errors))
+    return compiled
+
+
+def load(path: str = PATH_STRINGS) -> Dict[str, Any]:
+    """
+    Reads and compiles the strings data file without changing the strings in use.
+    :param path: Path to strings data file.
+    :return: Compiled strings data.
+    :raises ValueError: If the file isn't valid JSON, or if any strings are invalid.
+    """
+    with open(file=path, mode="r", encoding="utf8") as strings_file:
+        return compile_data(json.load(strings_file))
+
+def modified_time(path: str = PATH_STRINGS) -> float:
+    """
+    Gets the time the strings data file was last modified.
+    """
+    return os.stat(path).st_mtime
+
+def swap(data: Dict[str, Any]) -> None:
+    """
+    Replaces the strings in use with compiled strings data.
+    The data is swapped in a single assignment, so no lookups ever see a mix of old and new strings.
+    :param data: Compiled strings data, as returned by load.
+    """
+    global _data
+    _data = data
+
+
+_data: Dict[str, Any] = load()
 
 def get(__name: str) -> Optional[any]:
     return _data.get(__name)
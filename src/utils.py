@@ -3,15 +3,21 @@
 # Written by blueberry et al., 2022
 # https://github.com/StardewValleyDiscord/SDVAutumn2022
 
+import asyncio
 import re
 import typing
+import weakref
+from collections import OrderedDict
+from contextlib import asynccontextmanager
 
 import discord
 from discord import Member, User, PartialEmoji, Message, TextChannel, Guild, Forbidden, NotFound, Embed, Emoji
 from discord.abc import GuildChannel
 from discord.ext.commands import Context, Command, Bot
-from config import CHANNEL_ROLES, ROLE_ADMIN
-from typing import Any, List, Optional, Union
+import config
+from config import CHANNEL_ROLES, ROLE_ADMIN, FISHING_SCOREBOARD, MESSAGE_LOCATION_CACHE_SIZE, MESSAGE_SEARCH_CONCURRENCY, \
+    MEMBER_ROLES_CACHE_SIZE
+from typing import Any, List, Optional, Union, Dict, Tuple, Pattern, FrozenSet, AsyncIterator, Hashable
 
 import strings
 
@@ -23,6 +29,53 @@ class CheckFailureQuietly(discord.ext.commands.CheckFailure):
     pass
 
 
+class KeyedLocks:
+    """
+    Registry of async locks by key, such as a lock for each user to serialise changes to their balance.
+
+    Locks are only kept while in use, so the registry never grows beyond the keys currently held or waited on,
+    and operations on different keys never wait on each other.
+    """
+
+    def __init__(self):
+        self._locks: weakref.WeakValueDictionary = weakref.WeakValueDictionary()
+        """Map of keys to locks, dropped once no task holds or waits on them."""
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+    def get(self, key: Hashable) -> asyncio.Lock:
+        """
+        Gets the lock for a key, creating it if it's not in use.
+        Callers must keep a reference to the lock while using it.
+        """
+        lock: Optional[asyncio.Lock] = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        return lock
+
+    @asynccontextmanager
+    async def hold(self, *keys: Hashable) -> AsyncIterator[None]:
+        """
+        Holds the locks for all given keys until the context exits.
+        Locks are acquired in sorted order, so that tasks holding many keys can't deadlock with each other.
+        """
+        locks: List[asyncio.Lock] = [self.get(key=key) for key in sorted(set(keys))]
+        held: List[asyncio.Lock] = []
+        try:
+            for lock in locks:
+                await lock.acquire()
+                held.append(lock)
+            yield
+        finally:
+            for lock in reversed(held):
+                lock.release()
+
+
+user_locks: KeyedLocks = KeyedLocks()
+"""Locks for each Discord user ID, held while changing their balance based on a balance read beforehand."""
+
+
 def format_roles_error(error: str, roles: List[str]) -> str:
     """
     :param error: Unformatted error message.
@@ -31,6 +84,12 @@ def format_roles_error(error: str, roles: List[str]) -> str:
     """
     return error.format(", ".join([f"<@&{role}>" for role in roles]), f"<#{CHANNEL_ROLES}>")
 
+_member_roles: OrderedDict[Tuple[int, int], FrozenSet[int]] = OrderedDict()
+"""
+Map of Discord guild IDs and user IDs to IDs for all roles each member has, kept until their roles change,
+least-recently used first.
+"""
+
 def check_roles(user: Union[User, Member], role_ids: List[int]) -> bool:
     """
     Check roles
@@ -38,8 +97,29 @@ def check_roles(user: Union[User, Member], role_ids: List[int]) -> bool:
     :param role_ids: A list of role IDs to check for.
     :return: Whether a user has any of the roles in a given list.
     """
-    return (isinstance(user, Member)
-            and len(role_ids) > 0 and len([r for r in user.roles if r.id in role_ids]) > 0)
+    if not isinstance(user, Member) or not role_ids:
+        return False
+    key: Tuple[int, int] = (user.guild.id, user.id)
+    user_roles: Optional[FrozenSet[int]] = _member_roles.get(key)
+    if user_roles is None:
+        user_roles = _member_roles[key] = frozenset(role.id for role in user.roles)
+        while len(_member_roles) > MEMBER_ROLES_CACHE_SIZE:
+            _member_roles.popitem(last=False)
+    else:
+        _member_roles.move_to_end(key)
+    return not user_roles.isdisjoint(role_ids)
+
+def clear_roles(guild_id: int, user_id: Optional[int] = None) -> None:
+    """
+    Removes cached roles for a member whose roles have changed, or for all members of a guild.
+    :param guild_id: Discord guild ID for the guild the roles are in.
+    :param user_id: Discord user ID for a given member, or none to remove cached roles for all members of the guild.
+    """
+    if user_id is None:
+        for key in [key for key in _member_roles if key[0] == guild_id]:
+            del _member_roles[key]
+    else:
+        _member_roles.pop((guild_id, user_id), None)
 
 def requires_admin(ctx: Context) -> bool:
     """
@@ -56,23 +136,145 @@ def get_message_emojis(mesage: Message) -> typing.List[PartialEmoji]:
     emojis = re.findall('<(?P<animated>a?):(?P<name>[\w]{2,32}):(?P<id>[\d]{18,22})>', mesage.content)
     return [PartialEmoji(animated=bool(animated), name=name, id=id) for animated, name, id in emojis]
 
+class FishScanner:
+    """
+    Matcher for fish emoji in message content, compiled once from a scoreboard and scanning each message in a single pass.
+
+    Scoreboard keys that are valid emoji names are matched as custom emoji formatted as <:name:id> or <a:name:id>,
+    and all other keys are matched as literal text, such as unicode emoji.
+    """
+
+    def __init__(self, scoreboard: Dict[str, int]):
+        self.scoreboard: Dict[str, int] = dict(scoreboard)
+        """Map of fish to values, as given when compiled."""
+        names: List[str] = [fish for fish in self.scoreboard if re.fullmatch(r"\w{2,32}", fish)]
+        literals: List[str] = sorted([fish for fish in self.scoreboard if fish not in names], key=len, reverse=True)
+        patterns: List[str] = ([r"<a?:(" + "|".join(re.escape(name) for name in names) + r"):\d+>"] if names else []) \
+            + [re.escape(literal) for literal in literals]
+        self._pattern: Optional[Pattern] = re.compile("|".join(patterns)) if patterns else None
+
+    def scan(self, content: str) -> Tuple[Dict[str, int], int]:
+        """
+        Counts all fish in some message content.
+        :param content: Message content to search.
+        :return: Map of all fish in scoreboard order to the number of each found, and the total value of fish found.
+        """
+        counts: Dict[str, int] = dict.fromkeys(self.scoreboard, 0)
+        if self._pattern:
+            for match in self._pattern.finditer(content):
+                fish: str = match.group(1) if match.lastindex else match.group(0)
+                counts[fish] += 1
+        return counts, sum(self.scoreboard[fish] * count for fish, count in counts.items())
+
+
+_fish_scanner: FishScanner = FishScanner(scoreboard=FISHING_SCOREBOARD)
+
+def scan_fish(content: str, scoreboard: Dict[str, int] = FISHING_SCOREBOARD) -> Tuple[Dict[str, int], int]:
+    """
+    Counts all fish in some message content, recompiling the matcher only if the scoreboard has changed.
+    :param content: Message content to search.
+    :param scoreboard: Map of fish to values.
+    :return: Map of all fish in scoreboard order to the number of each found, and the total value of fish found.
+    """
+    global _fish_scanner
+    if _fish_scanner.scoreboard != scoreboard:
+        _fish_scanner = FishScanner(scoreboard=scoreboard)
+    return _fish_scanner.scan(content=content)
+
+_emojis: Dict[str, Emoji] = {}
+"""Map of names to custom emojis visible to the bot, taking the first emoji found for each name."""
+
+def index_emojis(bot: Bot) -> None:
+    """
+    Rebuilds the emoji index from all custom emojis visible to the bot, to be called whenever emojis change.
+    """
+    global _emojis
+    emojis: Dict[str, Emoji] = {}
+    for emoji in bot.emojis:
+        emojis.setdefault(emoji.name, emoji)
+    _emojis = emojis
+
+def get_emoji(bot: Bot, name: Optional[str]) -> Optional[Emoji]:
+    """
+    Gets a custom emoji by name from the emoji index, building the index if it's not yet been built.
+    :param bot: Bot instance with all visible emojis.
+    :param name: Name of the emoji.
+    :return: Emoji instance, if found.
+    """
+    if not _emojis:
+        index_emojis(bot=bot)
+    return _emojis.get(name)
+
+_help_lines: Dict[Command, str] = {}
+"""Map of commands to their lines in the help message, formatted once per command."""
+_help_embeds: Dict[tuple, Embed] = {}
+"""Map of help keys to help messages, with a message for each guild, permission class, and set of enabled features."""
+
+def clear_help() -> None:
+    """
+    Removes all cached help lines and messages, to be called whenever commands, strings, or emojis change.
+    """
+    _help_lines.clear()
+    _help_embeds.clear()
+
+def get_help_line(command: Command) -> str:
+    """
+    Gets the line in the help message for a command, formatting it if it's not yet cached.
+    """
+    line: Optional[str] = _help_lines.get(command)
+    if line is None:
+        line = _help_lines[command] = strings.get(
+            "help_command_format"
+            if not any(check.__name__ == requires_admin.__name__ for check in command.checks)
+            else "help_command_admin_format").format(
+            command_signature_to_string(command=command),
+            command.help.split("\n")[0] if command.help else "")
+    return line
+
+def index_help(bot: Bot) -> None:
+    """
+    Rebuilds help lines for all commands, to be called whenever commands are loaded.
+    """
+    clear_help()
+    for command in bot.commands:
+        get_help_line(command=command)
+
+async def get_help_message_for(ctx: Context) -> Embed:
+    """
+    Gets the help message for commands usable in a given context, building it if it's not yet cached.
+
+    Commands only check for admin roles and enabled features beyond the global check, so each message is cached by
+    guild, whether the author is an admin, and which features are enabled.
+    """
+    key: tuple = (
+        ctx.guild.id,
+        requires_admin(ctx),
+        config.SUBMISSION_ENABLED,
+        config.FISHING_ENABLED,
+        config.FORTUNE_ENABLED,
+        config.STRENGTH_ENABLED,
+        config.WHEEL_ENABLED,
+        config.CRYSTALBALL_ENABLED)
+    embed: Optional[Embed] = _help_embeds.get(key)
+    if not embed:
+        command_list: List[Command] = [command for command in ctx.bot.commands
+                                       if not command.hidden
+                                       and not command.name == "help"
+                                       and await command.can_run(ctx)]
+        embed = _help_embeds[key] = get_help_message(guild=ctx.guild, bot=ctx.bot, commands=command_list)
+    return embed
+
 def get_help_message(guild: Guild, bot: Bot, commands: Any) -> Embed:
-    emoji: Emoji = discord.utils.get(bot.emojis, name=strings.get("emoji_leaf"))
+    emoji: Emoji = get_emoji(bot=bot, name=strings.get("emoji_leaf"))
     embed_title = f"{emoji}\t{strings.get('help_title')}"
-    embed_description: str = "\n".join(
-        sorted([strings.get("help_command_format"
-                            if not any(check.__name__ == requires_admin.__name__ for check in command.checks)
-                            else "help_command_admin_format").format(
-            command_signature_to_string(command=command),
-            command.help.split("\n")[0] if command.help else ""
-        ) for command in commands]))
+    embed_description: str = "\n".join(sorted([get_help_line(command=command) for command in commands]))
     embed: Embed = Embed(
         title=embed_title,
         description=strings.get("help_content").format(embed_description),
         colour=guild.get_member(bot.user.id).colour)
-    thumbnail_url: str = discord.utils.get(bot.emojis, name=strings.get("emoji_puffer")).url
-    if thumbnail_url:
-        embed.set_thumbnail(url=thumbnail_url)
+    thumbnail: Optional[Emoji] = get_emoji(bot=bot, name=strings.get("emoji_puffer"))
+    if thumbnail:
+        embed.set_thumbnail(url=thumbnail.url)
     return embed
 
 def command_signature_to_string(command: Command) -> str:
@@ -104,25 +306,62 @@ def query_channel(guild: Guild, query: str) -> Optional[GuildChannel]:
     """
     return guild.get_channel(mention_to_id(query))
 
-async def get_guild_message(guild: Guild, message_id: int) -> Message:
+_message_channels: OrderedDict[int, int] = OrderedDict()
+"""Map of Discord message IDs to IDs for the channels containing them, least-recently used first."""
+
+def remember_message(message: Message) -> None:
+    """
+    Records the channel containing a message, so that finding it again with get_guild_message needs a single request.
+    """
+    _message_channels[message.id] = message.channel.id
+    _message_channels.move_to_end(message.id)
+    while len(_message_channels) > MESSAGE_LOCATION_CACHE_SIZE:
+        _message_channels.popitem(last=False)
+
+async def _fetch_message(channel: TextChannel, message_id: int, semaphore: asyncio.Semaphore) -> Optional[Message]:
+    async with semaphore:
+        try:
+            return await channel.fetch_message(message_id)
+        except (Forbidden, NotFound):
+            # Ignore channels we're unable to search, and channels that don't contain a matching message
+            return None
+
+async def get_guild_message(guild: Guild, message_id: int) -> Optional[Message]:
     """
     Source: Governor by StardewValleyDiscord.
 
     Returns a message in a guild by querying individual channels.
+    Messages in known channels are fetched directly, and otherwise all channels are queried concurrently,
+    stopping as soon as any channel returns the message.
     :param guild: Guild with channels to search in.
     :param message_id: Discord message ID to search for.
     :return: Message instance if found.
     """
-    for channel in guild.channels:
+    message_id = int(message_id)
+    semaphore: asyncio.Semaphore = asyncio.Semaphore(MESSAGE_SEARCH_CONCURRENCY)
+    message: Optional[Message] = None
+
+    channel_id: Optional[int] = _message_channels.get(message_id)
+    channel: Optional[GuildChannel] = guild.get_channel(channel_id) if channel_id else None
+    if isinstance(channel, TextChannel):
+        message = await _fetch_message(channel=channel, message_id=message_id, semaphore=semaphore)
+        if not message:
+            _message_channels.pop(message_id, None)
+
+    if not message:
+        tasks: List[asyncio.Task] = [
+            asyncio.create_task(_fetch_message(channel=channel, message_id=message_id, semaphore=semaphore))
+            for channel in guild.channels
+            if isinstance(channel, TextChannel)]
         try:
-            if isinstance(channel, TextChannel):
-                message = await channel.fetch_message(int(message_id))
-                return message
-        except Forbidden as e:
-            # Ignore channels we're unable to search
-            if e.code == 50001:
-                pass
-        except NotFound as e:
-            # Ignore channels that don't contain a matching message
-            if e.code == 10008:
-                pass
+            for task in asyncio.as_completed(tasks):
+                message = await task
+                if message:
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    if message:
+        remember_message(message=message)
+    return message